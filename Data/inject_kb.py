@@ -1,16 +1,45 @@
 # -*- coding: utf-8 -*-
 import os
+import re
+import math
+import codecs
+import json
+import shutil
+from itertools import islice
+from pathlib import Path
+
+# BLAS/OpenMP pools are sized when torch is first imported, so cap them here.
+# Beyond ~8 threads per process the encoder loses more to synchronisation
+# than it gains.
+ENCODE_THREADS = min(8, os.cpu_count() or 4)
+os.environ.setdefault("OMP_NUM_THREADS", str(ENCODE_THREADS))
+os.environ.setdefault("MKL_NUM_THREADS", str(ENCODE_THREADS))
+
+# Processes used for the bulk chunk encode (PyTorch backend on CPU). Spawned
+# workers inherit the thread caps above, so N processes x 8 threads fill the
+# host without fighting over cores.
+ENCODE_PROCESSES = max(1, (os.cpu_count() or 4) // 8)
+
 import chromadb
 import numpy as np
 from sentence_transformers import SentenceTransformer
 import nltk
 
-# Download sentence tokenizer (first run only)
+# Sentence tokenizer data is downloaded on first run by ensure_corpora()
 # To install this without internet
 # python3 -m nltk.downloader punkt punkt_tab
+NLTK_CORPORA = (
+    ("tokenizers/punkt", "punkt"),
+    ("tokenizers/punkt_tab", "punkt_tab"),
+)
+
 
-nltk.download('punkt')
-nltk.download('punkt_tab')
+def ensure_corpora():
+    for resource, package in NLTK_CORPORA:
+        try:
+            nltk.data.find(resource)
+        except LookupError:
+            nltk.download(package)
 
 
 # === CONFIG ===
@@ -20,53 +49,240 @@ KB_FILES = [
 
 CHROMA_PATH = "./vector_db"
 COLLECTION_NAME = "vector_kb"
+# Cosine matches the L2-normalised BGE vectors; M=16 keeps the HNSW graph small.
+# A generous construction_ef builds a good graph once; search_ef only has to
+# cover the top-10 the cross-encoder re-ranks, so it stays low for fast queries.
+COLLECTION_METADATA = {
+    "hnsw:space": "cosine",
+    "hnsw:M": 16,
+    "hnsw:construction_ef": 200,
+    "hnsw:search_ef": 50,
+}
 
 # === CHUNKING CONFIG ===
 MAX_TOKENS = 200     # Target chunk size
 OVERLAP_TOKENS = 40  # Semantic overlap for continuity
+SENTENCE_BATCH = 256 # Sentences tokenized/encoded per step; bounds memory
+
+_WHITESPACE_RE = re.compile(r'\s+')
+
+# === ENCODING CONFIG ===
+# 384-d small model: the cross-encoder re-ranks the top-N anyway, so recall@10
+# barely moves; must match settings.embed_model in app/config.py
+EMBED_MODEL = "BAAI/bge-small-en-v1.5"
+ENCODE_BATCH_SIZE = 64
+ADD_BATCH_SIZE = 200  # Rows per collection.add(); large single payloads stall Chroma
+MAX_SEQ_LENGTH = 512  # BGE context window; caps padding per batch
+
+# "onnx" runs the encoder on ONNX Runtime (exported once into ONNX_MODEL_DIR),
+# "torch" uses the stock SentenceTransformer/PyTorch path
+EMBED_BACKEND = "onnx"
+ONNX_MODEL_DIR = "./onnx_" + EMBED_MODEL.split("/")[-1]  # per model, so a stale export is never reused
+ONNX_MODEL_FILE = "model_optimized_quantized.onnx"
+
+# PyTorch backend only: FP16 weights on CUDA, int8 dynamic quantisation on CPU
+QUANTIZE_TORCH_MODEL = True
+
+
+# ---------- ONNX RUNTIME ENCODER ----------
+class OnnxEmbedder:
+    """Minimal drop-in for SentenceTransformer.encode() backed by ONNX Runtime.
+
+    Applies BGE's pooling (CLS token + L2 normalisation) so vectors stay
+    compatible with the SentenceTransformer model used at query time.
+    """
+
+    def __init__(self, model_dir, file_name=ONNX_MODEL_FILE):
+        from optimum.onnxruntime import ORTModelForFeatureExtraction
+        from transformers import AutoTokenizer
+
+        self.model = ORTModelForFeatureExtraction.from_pretrained(
+            model_dir, file_name=file_name, provider="CPUExecutionProvider"
+        )
+        self.tokenizer = AutoTokenizer.from_pretrained(model_dir, use_fast=True)
+        self.max_seq_length = MAX_SEQ_LENGTH
+
+    def get_sentence_embedding_dimension(self):
+        # CLS pooling: the embedding is the encoder's hidden state
+        return self.model.config.hidden_size
+
+    def encode(self, sentences, batch_size=32, show_progress_bar=False,
+               convert_to_numpy=True, convert_to_tensor=False, normalize_embeddings=True):
+        from tqdm import tqdm
+
+        batches = range(0, len(sentences), batch_size)
+        outputs = []
+        for start in tqdm(batches, disable=not show_progress_bar, desc="Batches"):
+            inputs = self.tokenizer(
+                sentences[start:start + batch_size],
+                padding=True,
+                truncation=True,
+                max_length=self.max_seq_length,
+                return_tensors="np",
+            )
+            hidden = self.model(**inputs).last_hidden_state
+            emb = np.asarray(hidden[:, 0], dtype=np.float32)
+            if normalize_embeddings:
+                emb /= np.linalg.norm(emb, axis=1, keepdims=True)
+            outputs.append(emb)
+        return np.vstack(outputs)
+
+
+def export_onnx_model(model_name=EMBED_MODEL, model_dir=ONNX_MODEL_DIR):
+    """One-off export: ONNX graph -> graph optimisation (level 99) -> int8
+    dynamic quantisation. Equivalent to
+    `optimum-cli export onnx --model <model> --task feature-extraction <dir>`
+    followed by ORTOptimizer/ORTQuantizer."""
+    from optimum.onnxruntime import ORTModelForFeatureExtraction, ORTOptimizer, ORTQuantizer
+    from optimum.onnxruntime.configuration import AutoQuantizationConfig, OptimizationConfig
+    from transformers import AutoTokenizer
+
+    print(f"?? Exporting {model_name} to ONNX ({model_dir})...")
+    model = ORTModelForFeatureExtraction.from_pretrained(model_name, export=True)
+    AutoTokenizer.from_pretrained(model_name, use_fast=True).save_pretrained(model_dir)
+
+    optimizer = ORTOptimizer.from_pretrained(model)
+    optimizer.optimize(save_dir=model_dir, optimization_config=OptimizationConfig(optimization_level=99))
+
+    quantizer = ORTQuantizer.from_pretrained(model_dir, file_name="model_optimized.onnx")
+    quantizer.quantize(
+        save_dir=model_dir,
+        quantization_config=AutoQuantizationConfig.avx512_vnni(is_static=False, per_channel=False),
+    )
 
 
-# ---------- HELPER: Sentence Token Count ----------
-def count_tokens(text, model):
-    return len(model.tokenizer.tokenize(text))
+def load_embed_model():
+    if EMBED_BACKEND == "onnx":
+        try:
+            if not os.path.exists(os.path.join(ONNX_MODEL_DIR, ONNX_MODEL_FILE)):
+                export_onnx_model()
+            return OnnxEmbedder(ONNX_MODEL_DIR)
+        except ImportError:
+            print("?? optimum[onnxruntime] not installed, falling back to PyTorch encoder "
+                  "(pip install optimum[onnxruntime])")
+
+    embed_model = SentenceTransformer(EMBED_MODEL)
+    embed_model.max_seq_length = MAX_SEQ_LENGTH
+
+    if QUANTIZE_TORCH_MODEL:
+        import torch
+        if torch.cuda.is_available():
+            embed_model.half()
+        else:
+            embed_model = torch.quantization.quantize_dynamic(
+                embed_model, {torch.nn.Linear}, dtype=torch.qint8
+            )
+    return embed_model
+
+
+# ---------- HELPER: Token Counts ----------
+def token_counts(texts, model):
+    """Token count per text, from one batched call to the fast tokenizer."""
+    return [
+        len(ids) for ids in model.tokenizer(
+            texts,
+            add_special_tokens=False,
+            padding=False,
+            truncation=False,
+        )["input_ids"]
+    ]
+
+
+# ---------- HELPER: Length-Sorted ("Smart") Batch Encoding ----------
+def encode_sorted(texts, lengths, model, show_progress_bar=False, pool=None):
+    """Encode texts sorted by token length so each mini-batch is padded only
+    to its own longest member, then restore the original order.
+
+    With a multi-process `pool`, the sorted texts are split across workers.
+    Embeddings are L2-normalised to match the query side in app/retriever.py.
+    """
+    order = np.argsort(lengths)
+    sorted_texts = [texts[i] for i in order]
+    if pool is not None:
+        n_workers = len(pool["processes"])
+        embs_sorted = model.encode_multi_process(
+            sorted_texts,
+            pool,
+            batch_size=ENCODE_BATCH_SIZE,
+            chunk_size=max(1, min(5000, math.ceil(len(texts) / n_workers / 10))),
+            normalize_embeddings=True,
+        )
+    else:
+        embs_sorted = model.encode(
+            sorted_texts,
+            batch_size=ENCODE_BATCH_SIZE,
+            convert_to_numpy=True,
+            convert_to_tensor=False,
+            show_progress_bar=show_progress_bar,
+            normalize_embeddings=True,
+        )
+    embeddings = np.empty_like(embs_sorted)
+    embeddings[order] = embs_sorted
+    return embeddings
 
 
 # ---------- SEMANTIC SENTENCE SPLITTING ----------
-def split_into_sentences(text):
-    from nltk.tokenize import sent_tokenize
-    return [s.strip() for s in sent_tokenize(text) if len(s.strip()) > 1]
+_PUNKT = None
 
 
-# ---------- CLUSTERED SEMANTIC CHUNKER (200 TOKENS) ----------
-def semantic_chunk(text, embed_model):
-    sentences = split_into_sentences(text)
+def _sentence_tokenizer():
+    """Load the English Punkt model once and reuse it for every paragraph."""
+    global _PUNKT
+    if _PUNKT is None:
+        try:
+            from nltk.tokenize.punkt import PunktTokenizer  # nltk >= 3.9 (punkt_tab)
+            _PUNKT = PunktTokenizer("english")
+        except ImportError:
+            _PUNKT = nltk.data.load("tokenizers/punkt/english.pickle")
+    return _PUNKT
+
 
-    if not sentences:
-        return []
+def split_into_sentences(paragraphs):
+    """Lazily yield sentences from an iterable of paragraphs."""
+    tokenize = _sentence_tokenizer().tokenize
+    for paragraph in paragraphs:
+        for s in tokenize(paragraph):
+            s = s.strip()
+            if len(s) > 1:
+                yield s
 
-    # Encode each sentence
-    sentence_embeddings = embed_model.encode(sentences, convert_to_numpy=True)
 
-    # Create clusters by similarity threshold
+# ---------- CLUSTERED SEMANTIC CHUNKER (200 TOKENS) ----------
+def semantic_chunk(paragraphs, embed_model):
+    """Chunk a stream of paragraphs, SENTENCE_BATCH sentences at a time, so
+    memory stays bounded regardless of document size."""
+    sentences = split_into_sentences(paragraphs)
+
+    # Pack consecutive sentences into token-bounded chunks
     chunks = []
-    current_chunk = []
+    current_chunk = []   # sentences in the open chunk
+    current_counts = []  # their token counts
     current_len = 0
 
-    for sentence, emb in zip(sentences, sentence_embeddings):
-        tokens = count_tokens(sentence, embed_model)
+    while True:
+        batch = list(islice(sentences, SENTENCE_BATCH))
+        if not batch:
+            break
 
-        # If chunk too large, close it
-        if current_len + tokens > MAX_TOKENS:
-            chunks.append(" ".join(current_chunk))
+        # Token count per sentence, computed once instead of re-tokenizing.
+        # Only chunks are embedded (in main); per-sentence vectors were never
+        # used for the boundaries and doubled the encoder work.
+        tok_counts = token_counts(batch, embed_model)
 
-            # Create overlap
-            overlap_sentences = current_chunk[-2:] if len(current_chunk) >= 2 else current_chunk
-            current_chunk = overlap_sentences.copy()
-            current_len = sum(count_tokens(s, embed_model) for s in current_chunk)
+        for sentence, tokens in zip(batch, tok_counts):
+            # If chunk too large, close it
+            if current_len + tokens > MAX_TOKENS:
+                chunks.append(" ".join(current_chunk))
 
-        # Add sentence
-        current_chunk.append(sentence)
-        current_len += tokens
+                # Create overlap
+                current_chunk = current_chunk[-2:]
+                current_counts = current_counts[-2:]
+                current_len = sum(current_counts)
+
+            # Add sentence
+            current_chunk.append(sentence)
+            current_counts.append(tokens)
+            current_len += tokens
 
     # Add last chunk
     if current_chunk:
@@ -75,56 +291,153 @@ def semantic_chunk(text, embed_model):
     return chunks
 
 
-# ---------- FILE LOADING + CHUNKING ----------
-def load_and_chunk_file(filepath, embed_model):
+# ---------- FILE LOADING ----------
+def _normalize(text):
+    return _WHITESPACE_RE.sub(' ', text).strip()
+
+
+def _text_file_encoding(filepath):
+    """utf-8 if the whole file decodes as utf-8, else latin-1 (checked in
+    fixed-size blocks, never holding the file in memory)."""
+    decoder = codecs.getincrementaldecoder("utf-8")()
+    try:
+        with open(filepath, "rb") as f:
+            for block in iter(lambda: f.read(1 << 16), b""):
+                decoder.decode(block)
+            decoder.decode(b"", final=True)
+    except UnicodeDecodeError:
+        return "latin-1"
+    return "utf-8"
+
+
+def iter_json_text(data):
+    """Yield "parent > key: value" lines for every scalar leaf of a JSON document.
+
+    Walks an explicit stack (no recursion limit, no per-level list merging);
+    children are pushed in reverse so leaves come out in document order.
+    """
+    stack = [(data, "")]
+    while stack:
+        obj, parent = stack.pop()
+        if isinstance(obj, dict):
+            for key, value in reversed(list(obj.items())):
+                stack.append((value, f"{parent} > {key}" if parent else str(key)))
+        elif isinstance(obj, list):
+            for item in reversed(obj):
+                stack.append((item, parent))
+        elif obj is not None:
+            text = _normalize(str(obj))
+            if text:
+                yield f"{parent}: {text}" if parent else text
+
+
+def iter_paragraphs(filepath):
+    """Yield whitespace-normalised paragraphs (docx paragraphs, PDF pages,
+    JSON leaves, blank-line separated blocks of text files)."""
     _, ext = os.path.splitext(filepath.lower())
-    
+
     if ext == '.docx':
         try:
             from docx import Document
-            doc = Document(filepath)
-            text = '\n'.join([paragraph.text for paragraph in doc.paragraphs if paragraph.text.strip()])
         except ImportError:
             raise ImportError("Install python-docx to process .docx files: pip install python-docx")
-    
+        for paragraph in Document(filepath).paragraphs:
+            text = _normalize(paragraph.text)
+            if text:
+                yield text
+
     elif ext == '.pdf':
         try:
-            import PyPDF2
-            with open(filepath, 'rb') as file:
-                pdf_reader = PyPDF2.PdfReader(file)
-                text = '\n'.join([page.extract_text() for page in pdf_reader.pages if page.extract_text()])
+            import pypdf
         except ImportError:
-            raise ImportError("Install PyPDF2 to process PDFs: pip install PyPDF2")
-    
+            raise ImportError("Install pypdf to process PDFs: pip install pypdf")
+        with open(filepath, 'rb') as file:
+            pdf_reader = pypdf.PdfReader(file, strict=False)
+            for page in pdf_reader.pages:
+                text = _normalize(page.extract_text() or '')  # extract once per page
+                if text:
+                    yield text
+
+    elif ext == '.json':
+        with open(filepath, "r", encoding=_text_file_encoding(filepath)) as f:
+            yield from iter_json_text(json.load(f))
+
     else:  # Plain text files
-        try:
-            with open(filepath, "r", encoding="utf-8") as f:
-                text = f.read()
-        except UnicodeDecodeError:
-            with open(filepath, "r", encoding="latin-1") as f:
-                text = f.read()
+        with open(filepath, "r", encoding=_text_file_encoding(filepath)) as f:
+            block = []
+            for line in f:
+                if line.strip():
+                    block.append(line)
+                elif block:
+                    yield _normalize(''.join(block))
+                    block = []
+            if block:
+                yield _normalize(''.join(block))
 
-    # Cleanup
-    text = ' '.join(text.split())  # Normalize whitespace
-    chunks = semantic_chunk(text, embed_model)
+
+# ---------- FILE LOADING + CHUNKING ----------
+def load_and_chunk_file(filepath, embed_model):
+    chunks = semantic_chunk(iter_paragraphs(filepath), embed_model)
 
     print(f" {filepath}: {len(chunks)} semantic chunks")
     return chunks
 
 
+# ---------- HELPER: Bulk-Load SQLite Settings ----------
+BULK_LOAD_PRAGMAS = (
+    "PRAGMA journal_mode=OFF",
+    "PRAGMA synchronous=OFF",
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA locking_mode=EXCLUSIVE",
+)
+
+
+def tune_sqlite_for_bulk_load(client):
+    """Drop SQLite durability for the one-shot ingest.
+
+    Only safe because main() wipes and rebuilds CHROMA_PATH on every run, so a
+    crash mid-ingest is recovered by simply rerunning the script. Relies on
+    Chroma's private SQLite handle, hence the broad guard.
+    """
+    try:
+        server = getattr(client, "_server", client)
+        conn = server._sysdb._conn_pool.connect()
+        for pragma in BULK_LOAD_PRAGMAS:
+            conn.execute(pragma)
+        print("?? SQLite tuned for bulk ingest (journal/sync off)")
+    except Exception as e:
+        print(f"?? Could not tune SQLite PRAGMAs, using Chroma defaults: {e}")
+
+
 # ---------- MAIN INGESTION ----------
 def main():
-    print("?? Initializing BGE-Large v1.5 Model...")
-    embed_model = SentenceTransformer("BAAI/bge-large-en-v1.5")
-    print(f"?? Embedding Model Ready (1024-dim)")
+    # Explicit intra-op thread count: some container runtimes default torch to
+    # a single thread. On >=16 core hosts the bulk chunk encode switches to
+    # multiple processes instead of more threads (see ENCODE_PROCESSES).
+    ensure_corpora()
+
+    import torch
+    torch.set_num_threads(ENCODE_THREADS)
+    try:
+        torch.set_num_interop_threads(1)
+    except RuntimeError:
+        pass  # inter-op pool already started
+
+    print(f"?? Initializing {EMBED_MODEL} Model...")
+    embed_model = load_embed_model()
+    print(f"?? Embedding Model Ready ({embed_model.get_sentence_embedding_dimension()}-dim)")
 
     # Reset DB
     print("??? Resetting ChromaDB...")
-    if os.path.exists(CHROMA_PATH):
-        os.system(f"rm -rf {CHROMA_PATH}")
+    db_path = Path(CHROMA_PATH).resolve()
+    cwd = Path.cwd().resolve()
+    if db_path == cwd or cwd not in db_path.parents:
+        raise ValueError(f"Refusing to delete {db_path}: CHROMA_PATH must be inside {cwd}")
+    shutil.rmtree(db_path, ignore_errors=True)
 
     client = chromadb.PersistentClient(path=CHROMA_PATH)
-    collection = client.create_collection(COLLECTION_NAME)
+    tune_sqlite_for_bulk_load(client)
+    collection = client.create_collection(COLLECTION_NAME, metadata=COLLECTION_METADATA)
 
     print("?? Loading & Chunking KB Files...\n")
 
@@ -146,15 +459,29 @@ def main():
     print(f"\n?? Total Chunks: {len(all_chunks)}")
     print("?? Generating Embeddings (May take a few minutes)...")
 
-    embeddings = embed_model.encode(all_chunks, convert_to_numpy=True)
+    chunk_lengths = token_counts(all_chunks, embed_model)
+    if (ENCODE_PROCESSES > 1 and isinstance(embed_model, SentenceTransformer)
+            and not torch.cuda.is_available()):
+        # Data-parallel encode across processes to get past the GIL
+        pool = embed_model.start_multi_process_pool(["cpu"] * ENCODE_PROCESSES)
+        try:
+            embeddings = encode_sorted(all_chunks, chunk_lengths, embed_model, pool=pool)
+        finally:
+            embed_model.stop_multi_process_pool(pool)
+    else:
+        embeddings = encode_sorted(all_chunks, chunk_lengths, embed_model, show_progress_bar=True)
+
+    # One contiguous float32 block; batches below are zero-copy row slices
+    embeddings = np.ascontiguousarray(embeddings, dtype=np.float32)
 
     print("?? Inserting into ChromaDB...")
-    collection.add(
-        documents=all_chunks,
-        embeddings=embeddings.tolist(),
-        metadatas=all_metadatas,
-        ids=all_ids
-    )
+    for i in range(0, len(all_ids), ADD_BATCH_SIZE):
+        collection.add(
+            documents=all_chunks[i:i + ADD_BATCH_SIZE],
+            embeddings=embeddings[i:i + ADD_BATCH_SIZE],
+            metadatas=all_metadatas[i:i + ADD_BATCH_SIZE],
+            ids=all_ids[i:i + ADD_BATCH_SIZE]
+        )
 
     print("\n? DONE! Zenius KB loaded into ChromaDB with Semantic 200-token Chunking.")
     print(f"?? DB Path: {CHROMA_PATH}")
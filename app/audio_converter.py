@@ -3,6 +3,8 @@ Audio conversion utilities for FreeSWITCH compatibility.
 """
 import soundfile as sf
 import numpy as np
+from math import gcd
+from scipy.signal import resample_poly
 from typing import Optional
 import logging
 
@@ -20,24 +22,20 @@ def convert_to_8khz_mono(input_path: str, output_path: str) -> Optional[str]:
     """
     try:
         # Read the audio file
-        data, sample_rate = sf.read(input_path)
+        data, sample_rate = sf.read(input_path, dtype='float32')
 
         # Convert to mono if stereo
         if len(data.shape) > 1:
-            data = np.mean(data, axis=1)
+            data = data.mean(axis=1, dtype=np.float32)
 
-        # Resample to 8kHz if necessary
+        # Resample to 8kHz if necessary (polyphase FIR, anti-aliased)
         if sample_rate != 8000:
-            # Calculate number of samples for 8kHz
-            n_samples = int(len(data) * 8000 / sample_rate)
-            data = np.interp(
-                np.linspace(0, len(data), n_samples),
-                np.arange(len(data)),
-                data
-            )
-
-        # Save as WAV with specific format
-        sf.write(output_path, data, 8000, subtype='PCM_16')
+            g = gcd(sample_rate, 8000)
+            data = resample_poly(data, 8000 // g, sample_rate // g)
+
+        # Scale to 16-bit PCM ourselves and save as WAV with specific format
+        pcm = np.clip(data * 32767.0, -32768, 32767).astype(np.int16)
+        sf.write(output_path, pcm, 8000, subtype='PCM_16')
         logger.info(f"Successfully converted audio to 8kHz mono: {output_path}")
         return output_path
 
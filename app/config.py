@@ -7,11 +7,53 @@ class Settings():
     # TTS settings
     tts_output_dir: str = "/usr/src/Conversational_IVR/ivr_response"
     tts_model: str = "tts_models/en/ljspeech/glow-tts"
+    tts_vocoder: str = "vocoder_models/en/ljspeech/hifigan_v2"  # Parallel vocoder; "" = model default
+    tts_use_gpu: bool = True  # Use CUDA when available, CPU otherwise
+    tts_fp16: bool = True     # fp16 autocast for TTS inference on CUDA
+    tts_sample_rate: int = 8000  # WAV rate for FreeSWITCH (0 = model's native rate)
+    tts_quantize: bool = True  # int8 dynamic quantization of the TTS model on CPU
+    tts_compile: bool = False  # torch.compile model/vocoder inference (slow first load)
+    tts_compile_cache_dir: str = "/var/cache/ivr_tts"  # Persistent Inductor FX graph cache
+    # int8 ONNX Runtime model for VITS TTS models (exported here on first load;
+    # "" = PyTorch). VITS has no separate vocoder, so pair it with tts_vocoder = ""
+    tts_onnx_path: str = ""
+    tts_worker_process: bool = False  # Host the model in one long-lived worker process
+    tts_cache_max_files: int = 500  # Cached WAVs for repeated prompts (LRU)
+    tts_phoneme_cache_size: int = 1024  # Memoized per-sentence tokenizer/G2P results (LRU)
+    tts_known_prompts: list = []  # Fixed prompts to phonemize at load (greetings, menus, errors)
     
     # LLM settings
     llm_api_url: str = "http://localhost:11434/api/chat"
     llm_timeout: int = 600
     max_conversation_history: int = 30
+    llm_stream: bool = True  # Stream the reply and synthesize TTS sentence by sentence
+    llm_structured_output: bool = False  # Ask Ollama for {"intent", "reply"} JSON instead of <intent> tags
+    llm_http2: bool = False          # Needs the h2 package and a TLS (https) Ollama endpoint
+    llm_max_connections: int = 128
+    llm_max_keepalive: int = 64
+    llm_keepalive_expiry: float = 60.0
+
+    # RAG settings
+    # Unix socket of a shared `uvicorn app.retrieval_server:app --uds ...` process;
+    # empty keeps the models in this process
+    retrieval_socket: str = ""
+    # Must match EMBED_MODEL in Data/inject_kb.py (rebuild the KB after changing it)
+    embed_model: str = "BAAI/bge-small-en-v1.5"
+    # "onnx" needs sentence-transformers>=3.2 + onnxruntime; a missing qint8 file can be
+    # created with sentence_transformers.export_dynamic_quantized_onnx_model(model, "avx512_vnni", ...)
+    embed_backend: str = "torch"
+    embed_onnx_file: str = "onnx/model_qint8_avx512_vnni.onnx"
+    embed_quantize: bool = True  # FP16 on CUDA, int8 dynamic quantization on CPU
+    context_cache_size: int = 2048  # Cached (query -> KB context) entries
+    context_cache_ttl: int = 600    # Seconds before a cached context is refreshed
+    rerank_backend: str = "torch"  # "onnx" needs sentence-transformers>=4.1 with onnxruntime
+    rerank_onnx_file: str = "onnx/model_qint8_avx512_vnni.onnx"
+    rerank_batch_size: int = 4  # Small length-sorted batches pad less on CPU
+    rerank_bettertransformer: bool = False  # Fused attention via optimum's BetterTransformer
+    rerank_bf16: bool = False  # bf16 autocast on CPUs with AVX512-BF16/AMX (Sapphire Rapids+)
+    rag_workers: int = 0  # Threads for Chroma query + re-rank (0 = min(4, CPU count))
+    semantic_cache_size: int = 1024       # Query embeddings kept for near-duplicate lookup
+    semantic_cache_threshold: float = 0.95  # Cosine similarity needed to reuse a cached context
 
 
 # SYSTEM_PROMPT = """You are a contact center agent helping customers over the phone. Speak naturally and warmly, like you're having a normal conversation with someone who called in for help.
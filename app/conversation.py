@@ -1,15 +1,25 @@
 """
 Conversation history management.
 """
-from typing import List, Dict, Optional
+from collections import deque
+from typing import Deque, List, Dict, Optional
 import logging
 
+from app.config import settings
+
 logger = logging.getLogger(__name__)
 
 class Conversation:
-    def __init__(self):
-        """Initialize conversation manager."""
-        self.conversations: Dict[str, List[Dict[str, str]]] = {}
+    def __init__(self, max_history: Optional[int] = None):
+        """Initialize conversation manager.
+
+        Args:
+            max_history: Messages kept per call (default: settings.max_conversation_history)
+        """
+        self.max_history = max_history or settings.max_conversation_history
+        self.conversations: Dict[str, Deque[Dict[str, str]]] = {}
+        # Latest assistant reply per call, kept alongside the history for O(1) reads
+        self._last_assistant: Dict[str, str] = {}
 
     def add_message(self, uuid: str, role: str, content: str):
         """Add a message to the conversation history.
@@ -20,16 +30,15 @@ class Conversation:
             content: Message content
         """
         if uuid not in self.conversations:
-            self.conversations[uuid] = []
+            # Bounded deque drops the oldest message in O(1) to avoid context length issues
+            self.conversations[uuid] = deque(maxlen=self.max_history)
         
         self.conversations[uuid].append({
             'role': role,
             'content': content
         })
-
-        # Keep only the last 10 messages to avoid context length issues
-        if len(self.conversations[uuid]) > 30:
-            self.conversations[uuid] = self.conversations[uuid][-30:]
+        if role == 'assistant':
+            self._last_assistant[uuid] = content
 
     def get_history(self, uuid: str) -> List[Dict[str, str]]:
         """Get conversation history for a specific call.
@@ -40,7 +49,26 @@ class Conversation:
         Returns:
             List of message dictionaries
         """
-        return self.conversations.get(uuid, [])
+        return list(self.conversations.get(uuid, ()))
+
+    def get_last_assistant(self, uuid: str) -> Optional[str]:
+        """Get the most recent assistant message for a specific call.
+
+        Args:
+            uuid: Call UUID
+
+        Returns:
+            Message content, or None if the assistant has not replied yet
+        """
+        return self._last_assistant.get(uuid)
+
+    def get_message_count(self, uuid: str) -> int:
+        """Get the number of stored messages for a specific call.
+
+        Args:
+            uuid: Call UUID
+        """
+        return len(self.conversations.get(uuid, ()))
 
     def clear_history(self, uuid: str):
         """Clear conversation history for a specific call.
@@ -49,4 +77,5 @@ class Conversation:
             uuid: Call UUID
         """
         if uuid in self.conversations:
-            del self.conversations[uuid]
\ No newline at end of file
+            del self.conversations[uuid]
+        self._last_assistant.pop(uuid, None)
\ No newline at end of file
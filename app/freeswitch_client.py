@@ -1,34 +1,65 @@
 """
 FreeSWITCH client handler for processing transcriptions and managing audio responses.
 """
+import asyncio
 import os
-import glob
-import time
+import mmap
 import logging
-import json
-from fastapi import APIRouter, HTTPException, Response
-from fastapi.responses import FileResponse
+import struct
+import numpy as np
+import orjson
+from fastapi import APIRouter, Depends, WebSocket, WebSocketDisconnect
+from fastapi.responses import ORJSONResponse, StreamingResponse
 from pydantic import BaseModel
-from typing import Dict, Any
+from typing import Any, Optional, Tuple
 
 logger = logging.getLogger(__name__)
 
-router = APIRouter(prefix="", tags=["freeswitch"])
+router = APIRouter(prefix="", tags=["freeswitch"], default_response_class=ORJSONResponse)
 
-def make_multipart_response(audio_path: str, llm_text: str, transfer_json: dict, status_code: int = 200):
+AUDIO_STREAM_CHUNK = 64 * 1024
+
+# Multipart framing is constant apart from the JSON body and the filename
+_BOUNDARY = "boundary12345"
+_MULTIPART_MEDIA_TYPE = f"multipart/mixed; boundary={_BOUNDARY}"
+_JSON_HDR = b"--boundary12345\r\nContent-Type: application/json\r\n\r\n"
+_AUDIO_HDR_PREFIX = (
+    b"--boundary12345\r\nContent-Type: audio/wav\r\n"
+    b"Content-Disposition: attachment; filename="
+)
+_AUDIO_HDR_SUFFIX = b"\r\n\r\n"
+_CRLF = b"\r\n"
+_CLOSING = b"\r\n--boundary12345--\r\n"
+
+# PCM16 mono WAV header for streamed replies: the RIFF and data sizes are left
+# open-ended since the reply length is not known when the first sentence is sent
+_STREAM_WAV_HEADER = struct.Struct("<4sI4s4sIHHIIHH4sI")
+
+# FreeSWITCH queue each LLM intent maps to
+_TRANSFER_MAP = {
+    "sales": ("sales", True),
+    "support": ("support", True),
+    "development": ("development", True),
+    "none": ("none", False)
+}
+
+async def make_multipart_response(audio_path: str = "", llm_text: str = "", transfer_json: Optional[dict] = None,
+                                  status_code: int = 200, json_payload: Optional[dict] = None):
     """
-    Build a multipart/mixed response for FreeSWITCH:
+    Build a streamed multipart/mixed response for FreeSWITCH:
     Part 1 → JSON body (LLM text + transfer info)
-    Part 2 → WAV audio bytes
+    Part 2 → WAV audio, memory-mapped and streamed as AUDIO_STREAM_CHUNK memoryview slices
     
     Args:
         audio_path: Path to the audio file
         llm_text: Text response from LLM
         transfer_json: Transfer information
         status_code: HTTP status code (default: 200)
+        json_payload: Error body; when given, a plain JSON response is returned
+            without touching the audio file
     """
-
-    boundary = "boundary12345"
+    if json_payload is not None:
+        return ORJSONResponse(content=json_payload, status_code=status_code)
 
     # ---- Prepare JSON PART ----
     json_payload = {
@@ -37,73 +68,102 @@ def make_multipart_response(audio_path: str, llm_text: str, transfer_json: dict,
         "transfer": transfer_json
     }
 
-    json_part = (
-        f"--{boundary}\r\n"
-        "Content-Type: application/json\r\n\r\n"
-        f"{json.dumps(json_payload)}\r\n"
-    ).encode()
-
-    # ---- Prepare AUDIO PART ----
-    with open(audio_path, "rb") as f:
-        audio_bytes = f.read()
+    json_part = _JSON_HDR + orjson.dumps(json_payload) + _CRLF
 
-    audio_part = (
-        f"--{boundary}\r\n"
-        "Content-Type: audio/wav\r\n"
-        f"Content-Disposition: attachment; filename={os.path.basename(audio_path)}\r\n\r\n"
-    ).encode() + audio_bytes + b"\r\n"
+    # ---- Prepare AUDIO PART header ----
+    audio_header = _AUDIO_HDR_PREFIX + os.path.basename(audio_path).encode() + _AUDIO_HDR_SUFFIX
 
-    # ---- Final boundary ----
-    closing = f"--{boundary}--\r\n".encode()
+    # Map before the response starts so a missing file still fails the request
+    fd = os.open(audio_path, os.O_RDONLY)
+    try:
+        size = os.fstat(fd).st_size
+        audio_map = mmap.mmap(fd, 0, prot=mmap.PROT_READ) if size else None
+    finally:
+        os.close(fd)
 
-    # ---- Combine Parts ----
-    final_body = json_part + audio_part + closing
+    async def body():
+        yield json_part
+        yield audio_header
+        if audio_map is not None:
+            view = memoryview(audio_map)
+            try:
+                # Slices share the mapping's pages, no per-chunk bytes copy
+                for offset in range(0, size, AUDIO_STREAM_CHUNK):
+                    yield view[offset:offset + AUDIO_STREAM_CHUNK]
+            finally:
+                view.release()
+                try:
+                    audio_map.close()
+                except BufferError:
+                    # The transport still holds a slice; the mapping is
+                    # released when that last export is dropped
+                    pass
+        yield _CLOSING
 
-    return Response(
-        content=final_body,
-        media_type=f"multipart/mixed; boundary={boundary}",
+    # ---- Stream Parts (no full-body concatenation) ----
+    return StreamingResponse(
+        body(),
+        media_type=_MULTIPART_MEDIA_TYPE,
         status_code=status_code
     )
 
 
 
+def find_latest_audio(audio_dir: str, call_uuid: str) -> Optional[Tuple[str, float, int]]:
+    """Return (path, mtime, size_bytes) of the newest response WAV for a call.
+
+    Single os.scandir pass: DirEntry caches the stat result, so each
+    candidate costs one syscall and no intermediate list is built.
+    """
+    uuid_part = f"_{call_uuid}_"
+    latest = None
+    with os.scandir(audio_dir) as entries:
+        for entry in entries:
+            name = entry.name
+            if name.startswith("response_") and name.endswith(".wav") and uuid_part in name:
+                st = entry.stat()
+                if latest is None or st.st_mtime > latest[1]:
+                    latest = (entry.path, st.st_mtime, st.st_size)
+    return latest
+
+
+async def get_agent() -> Any:
+    """Return the shared Conversational_IVR instance created in app.main.
+
+    Imported lazily because app.main imports this module to mount the router;
+    async so FastAPI resolves it inline instead of in its threadpool.
+    """
+    from app.main import agent
+    return agent
+
+
 class TranscriptionEvent(BaseModel):
     call_uuid: str
     transcription: str
 
 @router.post("/test/transcription")
-async def test_transcription(event: TranscriptionEvent):
+async def test_transcription(event: TranscriptionEvent, agent: Any = Depends(get_agent)):
     """
     Handle test transcription requests.
     
     This endpoint processes a transcription event, generates a response using the LLM,
     converts it to speech, and returns the audio file with metadata.
     """
-    from app.main import agent  # Import agent from main to avoid circular imports
-    import json
-    from datetime import datetime
-    
     try:
-        # Log the incoming request payload
-        request_data = {
-            "timestamp": datetime.utcnow().isoformat(),
-            "call_uuid": event.call_uuid,
-            "transcription": event.transcription,
-            "endpoint": "/test/transcription"
-        }
-        
-        logger.info("=== INCOMING REQUEST ===")
-        logger.info(json.dumps(request_data, indent=2))
-        logger.info("=======================")
+        # Log the incoming request (lazy %-formatting, no payload rebuild)
+        logger.info("Incoming /test/transcription call_uuid=%s chars=%d",
+                    event.call_uuid, len(event.transcription))
+        logger.debug("Transcription for %s: %s", event.call_uuid, event.transcription)
         # Process the transcription through the agent
-        await agent.handle_transcription(event.dict())
+        llm_response, intent = await agent.handle_transcription(event)
         
         # Find the latest audio file for this UUID
         audio_dir = agent.tts_client.output_dir
         if not os.path.exists(audio_dir):
             logger.error(f"Audio directory not found: {audio_dir}")
-            return make_multipart_response(
-                json_payload = {
+            return await make_multipart_response(
+                status_code=500,
+                json_payload={
                     "status": "error",
                     "message": "Audio directory not found",
                     "details": {
@@ -113,18 +173,20 @@ async def test_transcription(event: TranscriptionEvent):
                 }
             )
         
-        # Find all files matching the pattern for this UUID
-        # Pattern matches files like "response:01_uuid_timestamp.wav"
-        # pattern = os.path.join(audio_dir, f"response:*_{event.call_uuid}_*.wav")
+        # Find the newest file for this UUID
+        # Pattern matches files like "response_01_uuid_timestamp.wav"
         pattern = os.path.join(audio_dir, f"response_*_{event.call_uuid}_*.wav")
-        matching_files = glob.glob(pattern)
+        # O(1) lookup in the TTS client's index, which already carries mtime and
+        # size from write time; scan the directory only on a miss
+        entry = agent.tts_client.latest_by_uuid.get(event.call_uuid)
+        if entry is None:
+            entry = find_latest_audio(audio_dir, event.call_uuid)
         
-        if not matching_files:
+        if entry is None:
             logger.warning(f"No audio files found for UUID: {event.call_uuid}")
-            return make_multipart_response(
-                audio_path="",
-                llm_text="No audio file found for the given call UUID",
-                transfer_json={
+            return await make_multipart_response(
+                status_code=404,
+                json_payload={
                     "status": "not_found",
                     "message": "No audio file generated for the given call UUID",
                     "details": {
@@ -132,52 +194,28 @@ async def test_transcription(event: TranscriptionEvent):
                         "pattern_used": pattern,
                         "suggestion": "Check if the TTS service generated any files"
                     }
-                },
-                status_code=404
+                }
             )
         
-        # Get the most recently modified file
-        latest_file = max(matching_files, key=os.path.getmtime)
-        
-        # Verify file exists and has content
-        if not os.path.exists(latest_file) or os.path.getsize(latest_file) == 0:
-            logger.error(f"Audio file is empty or doesn't exist: {latest_file}")
-            return make_multipart_response(
+        latest_file, _, file_size = entry
+
+        # Verify file has content
+        if file_size == 0:
+            logger.error(f"Audio file is empty: {latest_file}")
+            return await make_multipart_response(
                 status_code=500,
                 json_payload={
                     "status": "error",
                     "message": "Generated audio file is invalid or empty",
                     "details": {
                         "file_path": latest_file,
-                        "file_exists": os.path.exists(latest_file),
-                        "file_size_bytes": os.path.getsize(latest_file) if os.path.exists(latest_file) else 0
+                        "file_exists": True,
+                        "file_size_bytes": file_size
                     }
                 }
             )
         
-        # Get the LLM response from the conversation history
-        conversation_history = agent.conversation.get_history(event.call_uuid)
-        llm_response = next((msg['content'] for msg in reversed(conversation_history) 
-                            if msg['role'] == 'assistant'), None)
-        # --- STEP 2: Intent extraction ---
-        import re
-
-        def extract_intent(text: str):
-            match = re.search(r"<intent>(.*?)</intent>", text, re.IGNORECASE)
-            if not match:
-                return "none"
-            return match.group(1).strip().lower()
-
-        intent = extract_intent(llm_response)
-
-        transfer_map = {
-            "sales": ("sales", True),
-            "support": ("support", True),
-            "development": ("development", True),
-            "none": ("none", False)
-        }
-
-        queue, should_transfer = transfer_map.get(intent, ("none", False))
+        queue, should_transfer = _TRANSFER_MAP.get(intent, ("none", False))
 
         transfer_json = {
             "transfer_request": should_transfer,
@@ -185,46 +223,11 @@ async def test_transcription(event: TranscriptionEvent):
         }
         logger.info(f"Transfer JSON: {transfer_json}")
         
-        # Prepare response metadata
-        import json
-        import base64
-        
-        file_metadata = {
-            "status": "success",
-            "file_details": {
-                "filename": os.path.basename(latest_file),
-                "size_bytes": os.path.getsize(latest_file),
-                "last_modified": time.ctime(os.path.getmtime(latest_file)),
-                "call_uuid": event.call_uuid
-            },
-            "conversation": {
-                "message_count": len(conversation_history),
-                "last_interaction": time.ctime()
-            }
-        }
-        
-        # Encode metadata as base64 to safely include in headers
-        metadata_str = json.dumps(file_metadata)
-        encoded_metadata = base64.urlsafe_b64encode(metadata_str.encode()).decode()
-        
         # Log the successful response (without the full LLM response to keep logs clean)
-        logger.info(f"Sending audio file. Size: {os.path.getsize(latest_file)} bytes, "
+        logger.info(f"Sending audio file. Size: {file_size} bytes, "
                    f"Call UUID: {event.call_uuid}")
         
-        # Return the audio file with minimal, safe headers
-        # response = FileResponse(
-        #     latest_file, 
-        #     media_type="audio/wav",
-        #     filename=os.path.basename(latest_file),
-        #     headers={
-        #         "Content-Disposition": f"attachment; filename={os.path.basename(latest_file)}",
-        #         "X-File-Metadata": encoded_metadata,
-        #         "X-Status": "success"
-        #     }
-        # )
-        # return response
-
-        return make_multipart_response(
+        return await make_multipart_response(
             audio_path=latest_file,
             llm_text=llm_response,
             transfer_json=transfer_json
@@ -232,7 +235,7 @@ async def test_transcription(event: TranscriptionEvent):
         
     except Exception as e:
         logger.exception(f"Error processing transcription: {str(e)}")
-        return make_multipart_response(
+        return await make_multipart_response(
             status_code=500,
             json_payload={
                 "status": "error",
@@ -240,3 +243,77 @@ async def test_transcription(event: TranscriptionEvent):
                 "details": str(e)
             }
         )
+
+
+def _stream_wav_header(sample_rate: int) -> bytes:
+    return _STREAM_WAV_HEADER.pack(
+        b"RIFF", 0xFFFFFFFF, b"WAVE", b"fmt ", 16, 1, 1,
+        sample_rate, sample_rate * 2, 2, 16, b"data", 0xFFFFFFFF - 36
+    )
+
+
+def _read_file(path: str) -> bytes:
+    with open(path, "rb") as f:
+        return f.read()
+
+
+@router.websocket("/test/transcription_stream")
+async def transcription_stream(websocket: WebSocket, agent: Any = Depends(get_agent)):
+    """
+    Streamed counterpart of /test/transcription, one WebSocket per call.
+
+    For every TranscriptionEvent (JSON text message) the reply audio is sent as
+    binary messages while it is synthesized: a WAV header, then the PCM of each
+    sentence. When the reply is not streamed sentence by sentence the rendered
+    WAV is sent as one message instead. A JSON text message with the LLM text
+    and transfer info closes each reply.
+    """
+    await websocket.accept()
+    try:
+        while True:
+            event = TranscriptionEvent(**orjson.loads(await websocket.receive_text()))
+            logger.info("Incoming /test/transcription_stream call_uuid=%s chars=%d",
+                        event.call_uuid, len(event.transcription))
+            streamed = False
+
+            async def send_audio(pcm: np.ndarray):
+                nonlocal streamed
+                if not streamed:
+                    await websocket.send_bytes(_stream_wav_header(agent.tts_client.output_sample_rate))
+                    streamed = True
+                await websocket.send_bytes(pcm.tobytes())
+
+            llm_response, intent = await agent.handle_transcription(event, on_audio=send_audio)
+            if not llm_response:
+                await websocket.send_text(orjson.dumps({
+                    "status": "error",
+                    "message": "Failed to get LLM response"
+                }).decode())
+                continue
+
+            if not streamed:
+                entry = agent.tts_client.latest_by_uuid.get(event.call_uuid)
+                if entry is None:
+                    entry = find_latest_audio(agent.tts_client.output_dir, event.call_uuid)
+                if entry is not None and entry[2]:
+                    await websocket.send_bytes(await asyncio.to_thread(_read_file, entry[0]))
+                else:
+                    logger.warning(f"No audio files found for UUID: {event.call_uuid}")
+
+            queue, should_transfer = _TRANSFER_MAP.get(intent, ("none", False))
+            await websocket.send_text(orjson.dumps({
+                "status": "success",
+                "llm_response": llm_response,
+                "transfer": {
+                    "transfer_request": should_transfer,
+                    "transfer_target": queue
+                }
+            }).decode())
+    except WebSocketDisconnect:
+        logger.info("Transcription stream closed by client")
+    except Exception as e:
+        logger.exception(f"Error in transcription stream: {str(e)}")
+        try:
+            await websocket.close(code=1011)
+        except RuntimeError:
+            pass  # already closed by the client
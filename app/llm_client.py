@@ -1,104 +1,154 @@
 import logging
+import re
 import httpx
+import orjson
 from app.config import settings
-from sentence_transformers import SentenceTransformer, CrossEncoder
-import chromadb
-import asyncio
+from app import retriever
+from typing import Callable, Optional, Tuple
 
 logger = logging.getLogger(__name__)
 
-# Load embedding model + ChromaDB at startup (global cache)
-try:
-    # Embedding model for initial retrieval
-    model = SentenceTransformer("BAAI/bge-large-en-v1.5")
-    
-    # Cross-encoder model for re-ranking
-    reranker = CrossEncoder('cross-encoder/ms-marco-MiniLM-L-6-v2')
-    
-    client = chromadb.PersistentClient(path="./Data/zenius_db")
-    collection = client.get_collection("zenius_kb")
-    logger.info("? Zenius KB successfully loaded into memory for RAG retrieval.")
-    logger.info("? Re-ranker model loaded successfully.")
-except Exception as e:
-    logger.exception("? Failed to initialize ChromaDB or embedding model.")
+
+# Intent tag the prompt asks the LLM to append, e.g. "<intent>sales</intent>"
+_INTENT_RE = re.compile(r"<intent>(.*?)</intent>", re.IGNORECASE)
+
+
+# Sentence boundary inside a streamed reply: whitespace after . ! or ?
+_SENTENCE_END_RE = re.compile(r"(?<=[.!?])\s+")
+
+
+def extract_intent(text: Optional[str]) -> str:
+    """Return the lower-cased intent tagged in an LLM reply, or "none"."""
+    match = _INTENT_RE.search(text or "")
+    return match.group(1).strip().lower() if match else "none"
+
+
+# Ollama structured-output schema; "intent" comes first so it is decoded before
+# the (longer) spoken reply
+REPLY_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "intent": {"type": "string", "enum": ["sales", "support", "development", "none"]},
+        "reply": {"type": "string"}
+    },
+    "required": ["intent", "reply"]
+}
+
+
+def parse_reply(content: str) -> Tuple[str, str]:
+    """Split raw LLM message content into (reply text, intent).
+
+    Structured (JSON) replies are decoded directly; anything else falls back to
+    the <intent> tag regex.
+
+    Args:
+        content: Message content returned by Ollama
+
+    Returns:
+        Tuple of (reply text, intent)
+    """
+    if settings.llm_structured_output:
+        try:
+            data = orjson.loads(content)
+            return data["reply"], str(data.get("intent") or "none").strip().lower()
+        except (orjson.JSONDecodeError, KeyError, TypeError):
+            logger.warning("?? LLM ignored the JSON reply format, falling back to intent tags")
+    return content, extract_intent(content)
+
+
+# One pooled HTTP client per process, shared by every LLMClient, so concurrent
+# calls reuse a handful of keep-alive connections to Ollama
+_http_client = None
+
+
+def get_http_client(timeout) -> httpx.AsyncClient:
+    """Return the process-wide AsyncClient, creating it on first use.
+
+    Args:
+        timeout: Request timeout in seconds
+
+    Returns:
+        Shared httpx.AsyncClient
+    """
+    global _http_client
+    if _http_client is None or _http_client.is_closed:
+        # httpx ignores the client's limits/http2 once a transport is given,
+        # so the pool is configured on the transport itself
+        _http_client = httpx.AsyncClient(
+            timeout=timeout,
+            transport=httpx.AsyncHTTPTransport(
+                http2=settings.llm_http2,
+                limits=httpx.Limits(
+                    max_keepalive_connections=settings.llm_max_keepalive,
+                    max_connections=settings.llm_max_connections,
+                    keepalive_expiry=settings.llm_keepalive_expiry,
+                ),
+                retries=1,
+            ),
+        )
+    return _http_client
 
 
 class LLMClient:
+    # Prompt wrapped around the current user message when KB context is found
+    _KB_PROMPT_TMPL = (
+        "You should respond as a Voice Assistant of Zenius IT services. "
+        "### Relevant Knowledge Base Information ###\n"
+        "{kb}\n"
+        "### End of Knowledge Base Information ###\n\n"
+        "User Question: {q}"
+    )
+
     def __init__(self, api_url=None, timeout=None):
         """Initialize LLM client."""
         self.api_url = api_url or settings.llm_api_url
         self.timeout = timeout or settings.llm_timeout
-        self.client = httpx.AsyncClient(timeout=self.timeout)
+        self.client = get_http_client(self.timeout)
+        # Optional shared retrieval sidecar (app.retrieval_server) on a Unix socket
+        self.retrieval_client = None
+        if settings.retrieval_socket:
+            self.retrieval_client = httpx.AsyncClient(
+                base_url="http://retrieval",
+                timeout=self.timeout,
+                transport=httpx.AsyncHTTPTransport(uds=settings.retrieval_socket)
+            )
         logger.info(f"LLMClient initialized with API URL: {self.api_url}")
 
+    async def warm_up(self):
+        """Warm the in-process RAG models (the sidecar warms itself at startup)."""
+        if self.retrieval_client is None:
+            await retriever.warm_up()
+
     async def _retrieve_context(self, user_query: str, initial_results: int = 10, final_results: int = 1) -> str:
-        """
-        Retrieve top relevant KB chunks using two-stage retrieval:
-        1. Retrieve top-N chunks using semantic similarity (embedding)
-        2. Re-rank using cross-encoder and return top-K
-        
+        """Retrieve re-ranked KB context in-process or from the retrieval sidecar.
+
         Args:
             user_query: The user's query string
             initial_results: Number of chunks to retrieve initially (default: 10)
             final_results: Number of top chunks to return after re-ranking (default: 1)
-        
+
         Returns:
             Concatenated context string from top re-ranked chunks
         """
+        if self.retrieval_client is None:
+            return await retriever.retrieve_context(user_query, initial_results, final_results)
         try:
-            logger.info(f"?? Retrieving KB context for query: {user_query}")
-            
-            # Stage 1: Initial retrieval using embeddings (top-10)
-            query_embedding = model.encode(user_query)
-            
-            # Convert ndarray to list
-            if hasattr(query_embedding, "tolist"):
-                query_embedding = query_embedding.tolist()
-
-            results = collection.query(
-                query_embeddings=[query_embedding], 
-                n_results=initial_results
+            response = await self.retrieval_client.post(
+                "/retrieve",
+                content=orjson.dumps({
+                    "query": user_query,
+                    "initial_results": initial_results,
+                    "final_results": final_results
+                }),
+                headers={"Content-Type": "application/json"}
             )
-
-            if not results or not results["documents"] or not results["documents"][0]:
-                logger.warning("?? No KB context found for this query.")
-                return ""
-
-            docs = results["documents"][0]
-            logger.info(f"?? Retrieved {len(docs)} initial KB chunks")
-            
-            # Stage 2: Re-ranking using cross-encoder
-            if len(docs) > 0:
-                # Create query-document pairs for re-ranking
-                pairs = [[user_query, doc] for doc in docs]
-                
-                # Get re-ranking scores
-                scores = reranker.predict(pairs)
-                
-                # Sort documents by score (descending)
-                ranked_indices = scores.argsort()[::-1]
-                
-                # Select top-K documents after re-ranking
-                top_docs = [docs[idx] for idx in ranked_indices[:final_results]]
-                
-                logger.info(f"?? Re-ranked and selected top-{final_results} chunk(s)")
-                logger.debug(f"Top re-ranking scores: {sorted(scores, reverse=True)[:final_results]}")
-                
-                # Log the actual context being used
-                for i, doc in enumerate(top_docs, 1):
-                    preview = doc[:200] + '...' if len(doc) > 200 else doc
-                    logger.info(f"   Context chunk {i}: {preview}")
-                
-                context = "\n\n".join(top_docs)
-                return context
-            
-            return ""
-            
-        except Exception as e:
-            logger.exception("Error retrieving KB context.")
+            response.raise_for_status()
+            return orjson.loads(response.content)["context"]
+        except Exception:
+            logger.exception("Error retrieving KB context from retrieval sidecar.")
             return ""
 
-    async def _compress_conversation_history(self, conversation_history, max_messages: int = 6):
+    def _compress_conversation_history(self, conversation_history, max_messages: int = 6):
         """
         Compress conversation history to reduce context length while maintaining coherence.
         Keeps: most recent messages + system-critical info
@@ -117,25 +167,41 @@ class LLMClient:
         # This maintains immediate context while reducing token count
         compressed = conversation_history[-max_messages:]
         
-        logger.info(f"?? Compressed conversation: {len(conversation_history)} ? {len(compressed)} messages")
+        logger.info("?? Compressed conversation: %d ? %d messages", len(conversation_history), len(compressed))
         return compressed
 
     async def get_response(self, conversation_history):
         """Get response from LLM API, injecting Zenius KB context dynamically."""
+        reply, _ = await self.get_reply(conversation_history)
+        return reply
+
+    async def get_reply(self, conversation_history, on_sentence: Optional[Callable[[str], None]] = None) -> Tuple[Optional[str], str]:
+        """Get the LLM reply together with the caller intent.
+
+        Args:
+            conversation_history: Conversation messages for the call
+            on_sentence: Called with each complete sentence while the reply is
+                still streaming (settings.llm_stream, plain-text replies only)
+
+        Returns:
+            Tuple of (reply text or None on failure, intent)
+        """
         try:
             # First compress the conversation history to manage context length
-            compressed_history = await self._compress_conversation_history(conversation_history)
+            compressed_history = self._compress_conversation_history(conversation_history)
             
-            # Extract latest user message for retrieval
-            user_query = ""
-            for msg in reversed(conversation_history):
-                if msg["role"] == "user":
-                    user_query = msg["content"]
+            # Locate the latest user message once, by index: it is both the
+            # retrieval query and the message that receives the KB context
+            inject_idx = None
+            for i in range(len(compressed_history) - 1, -1, -1):
+                if compressed_history[i]["role"] == "user":
+                    inject_idx = i
                     break
+            user_query = compressed_history[inject_idx]["content"] if inject_idx is not None else ""
 
             if not user_query:
                 logger.warning("?? No user query found in conversation history")
-                return None
+                return None, "none"
 
             # 1?? Fetch relevant KB context from Chroma (top-10, re-ranked to top-1)
             kb_context = await self._retrieve_context(
@@ -145,79 +211,126 @@ class LLMClient:
             )
 
             # 2?? Prepare messages for LLM API
-            messages = []
-            context_injected = False
-            
-            for msg in compressed_history:
-                content = msg["content"]
-                
+            # History entries are already {"role", "content"} dicts: send them as
+            # is and only swap in a new dict for the message that gets KB context
+            messages = compressed_history
+
+            if kb_context:
+                if messages is conversation_history:
+                    # Uncompressed: copy before replacing so the caller's list is untouched
+                    messages = list(messages)
                 # Inject KB context ONLY into the last user message (current query)
-                # Check by comparing with user_query AND ensuring we haven't injected yet
-                if (msg["role"] == "user" and 
-                    content == user_query and 
-                    kb_context and 
-                    not context_injected):
-                    
-                    content = (
-                        f"You should respond as a Voice Assistant of Zenius IT services. "
-                        f"### Relevant Knowledge Base Information ###\n"
-                        f"{kb_context}\n"
-                        f"### End of Knowledge Base Information ###\n\n"
-                        f"User Question: {content}"
-                    )
-                    context_injected = True
-                    logger.info(f"?? Injected KB context into the latest user message")
-                
-                messages.append({
-                    "role": msg["role"],
-                    "content": content
-                })
+                messages[inject_idx] = {
+                    "role": "user",
+                    "content": self._KB_PROMPT_TMPL.format_map({"kb": kb_context, "q": user_query})
+                }
+                logger.info("?? Injected KB context into the latest user message")
 
             # Log final messages being sent
-            logger.info(f"?? Sending {len(messages)} messages to LLM")
-            for i, msg in enumerate(messages, 1):
-                preview = msg['content'][:200] + '...' if len(msg['content']) > 200 else msg['content']
-                logger.info(f"   Message {i} [{msg['role'].upper()}]: {preview}")
+            logger.info("?? Sending %d messages to LLM", len(messages))
+            if logger.isEnabledFor(logging.DEBUG):
+                for i, msg in enumerate(messages, 1):
+                    preview = msg['content'][:200] + '...' if len(msg['content']) > 200 else msg['content']
+                    logger.debug("   Message %d [%s]: %s", i, msg['role'].upper(), preview)
 
             payload = {
                 "model": "zenius-llm",  # custom Ollama model with built-in system prompt
                 "messages": messages,
-                "stream": False
+                "stream": settings.llm_stream
             }
+            if settings.llm_structured_output:
+                payload["format"] = REPLY_SCHEMA
+                # Raw JSON fragments are not speakable sentences
+                on_sentence = None
 
-            logger.debug(f"LLM payload (truncated): {str(payload)[:800]}")
+            body = orjson.dumps(payload)
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug("LLM payload (truncated): %r", body[:800])
 
-            # 3?? Send to Ollama API
-            response = await self.client.post(
-                self.api_url,
-                json=payload,
-                headers={"Content-Type": "application/json"}
-            )
-            response.raise_for_status()
+            # 3?? Send to Ollama API (pre-serialized, so httpx does not re-encode)
+            if settings.llm_stream:
+                content = await self._stream_content(body, on_sentence)
+            else:
+                response = await self.client.post(
+                    self.api_url,
+                    content=body,
+                    headers={"Content-Type": "application/json"}
+                )
+                response.raise_for_status()
 
-            data = response.json()
-            if "message" not in data:
-                raise ValueError(f"Invalid response format from Ollama API: {data}")
+                data = response.json()
+                if "message" not in data:
+                    raise ValueError(f"Invalid response format from Ollama API: {data}")
+                content = data["message"]["content"]
 
-            llm_response = data["message"]["content"]
-            logger.info(f"? Received response from LLM API: {llm_response[:100]}...")
-            return llm_response
+            llm_response, intent = parse_reply(content)
+            logger.info("? Received response from LLM API: %.100s...", llm_response)
+            return llm_response, intent
 
         except httpx.HTTPStatusError as e:
             body = e.response.text if hasattr(e.response, "text") else "<unreadable>"
             logger.error(f"HTTP error from LLM API: {e.response.status_code} - {body}")
-            return None
+            return None, "none"
         except httpx.RequestError as e:
             logger.exception(f"Request error to LLM API: {e}")
-            return None
+            return None, "none"
         except Exception:
             logger.exception("Unexpected error calling LLM API")
-            return None
+            return None, "none"
+
 
+    async def _stream_content(self, body: bytes, on_sentence: Optional[Callable[[str], None]]) -> str:
+        """POST a streaming chat request and collect the reply.
+
+        Ollama sends one JSON object per line; complete sentences are handed to
+        `on_sentence` as soon as their closing punctuation arrives.
+
+        Args:
+            body: Serialized chat payload with "stream": true
+            on_sentence: Optional per-sentence callback
+
+        Returns:
+            Full message content
+        """
+        parts = []
+        pending = ""
+        async with self.client.stream(
+            "POST",
+            self.api_url,
+            content=body,
+            headers={"Content-Type": "application/json"}
+        ) as response:
+            if response.is_error:
+                await response.aread()
+                response.raise_for_status()
+            async for line in response.aiter_lines():
+                if not line:
+                    continue
+                chunk = orjson.loads(line)
+                if "error" in chunk:
+                    raise ValueError(f"Ollama API error: {chunk['error']}")
+                piece = chunk.get("message", {}).get("content", "")
+                if piece:
+                    parts.append(piece)
+                    if on_sentence is not None:
+                        pending += piece
+                        *complete, pending = _SENTENCE_END_RE.split(pending)
+                        for sentence in complete:
+                            on_sentence(sentence)
+                if chunk.get("done"):
+                    break
+        if on_sentence is not None and pending.strip():
+            on_sentence(pending)
+        return "".join(parts)
 
     async def close(self):
-        """Close the HTTP client."""
+        """Close the shared HTTP client."""
+        global _http_client
         await self.client.aclose()
+        if _http_client is self.client:
+            _http_client = None
+        if self.retrieval_client is not None:
+            await self.retrieval_client.aclose()
         logger.info("LLMClient connection closed")
 
     async def __aenter__(self):
@@ -2,7 +2,8 @@ import asyncio
 import logging
 import os
 import time
-from typing import Dict, Any
+from typing import Any, Awaitable, Callable, Optional, Tuple
+import numpy as np
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 
@@ -26,6 +27,7 @@ agent = None
 
 from app.config import settings
 from app.llm_client import LLMClient
+from app.retriever import load_rag_resources
 from app.tts_client import TTSClient
 from app.conversation import Conversation
 
@@ -42,7 +44,8 @@ logger = logging.getLogger(__name__)
 async def warm_up_llm():
     """Preload Ollama model to prevent first-request cold start."""
     try:
-        llm = LLMClient()
+        # Reuse the agent's client so the warm-up also opens the pooled connection
+        llm = agent.llm_client
         payload = {
             "model": "zenius-llm",
             "messages": [{"role": "user", "content": "Warmup request - respond with OK"}],
@@ -50,7 +53,6 @@ async def warm_up_llm():
         }
         await llm.client.post(llm.api_url, json=payload)
         logger.info("🔥 LLM model preloaded successfully (no cold start expected).")
-        await llm.close()
     except Exception as e:
         logger.warning(f"Warm-up failed: {e}")
 
@@ -60,7 +62,7 @@ class Conversational_IVR:
         """Initialize the support agent components."""
         # Initialize components
         self.llm_client = LLMClient()
-        self.tts_client = TTSClient(output_dir=settings.tts_output_dir)
+        self.tts_client = TTSClient(model_name=settings.tts_model, output_dir=settings.tts_output_dir)
         self.conversation = Conversation()
 
     async def initialize(self) -> bool:
@@ -69,6 +71,11 @@ class Conversational_IVR:
             # Initialize TTS client
             if not await self.tts_client.initialize():
                 return False
+
+            # Load the RAG models once, off the event loop, unless a shared
+            # retrieval sidecar hosts them; retrieval degrades to no KB context
+            if not settings.retrieval_socket and not await asyncio.to_thread(load_rag_resources):
+                logger.warning("RAG resources unavailable, continuing without KB context")
             
             logger.info("Successfully initialized all components")
             return True
@@ -76,15 +83,24 @@ class Conversational_IVR:
             logger.error(f"Error during initialization: {e}")
             return False
 
-    async def handle_transcription(self, event: Dict[str, Any]):
+    async def handle_transcription(
+        self,
+        event: Any,
+        on_audio: Optional[Callable[[np.ndarray], Awaitable[None]]] = None
+    ) -> Tuple[Optional[str], str]:
         """Handle transcription events from FreeSWITCH.
 
         Args:
-            event: Event data containing call_uuid and transcription
+            event: TranscriptionEvent carrying call_uuid and transcription
+            on_audio: Optional coroutine given each streamed TTS segment's
+                int16 PCM as soon as it is synthesized
+
+        Returns:
+            (LLM response text or None, intent extracted from the response)
         """
         try:
-            call_uuid = event['call_uuid']
-            transcription = event['transcription']
+            call_uuid = event.call_uuid
+            transcription = event.transcription
 
             # Add user message to conversation history
             self.conversation.add_message(call_uuid, 'user', transcription)
@@ -93,25 +109,36 @@ class Conversational_IVR:
             history = self.conversation.get_history(call_uuid)
             logger.debug(f"Conversation history for {call_uuid} (count={len(history)}): {history}")
  
-            # Get LLM response
-            response = await self.llm_client.get_response(history)
+            # Get LLM response and caller intent; when streaming, each finished
+            # sentence starts synthesizing while the LLM is still generating
+            speech = self.tts_client.start_stream(call_uuid) if settings.llm_stream else None
+            response, intent = await self.llm_client.get_reply(
+                history,
+                on_sentence=speech.feed if speech else None
+            )
 
             if response:
                 # Add assistant response to conversation history
                 self.conversation.add_message(call_uuid, 'assistant', response)
 
-                # Generate speech from response
-                audio_path = await self.tts_client.generate_speech(response, call_uuid)
+                # Generate speech from response (whole reply if nothing was streamed)
+                audio_path = await speech.finish(on_audio) if speech else None
+                if not audio_path:
+                    audio_path = await self.tts_client.generate_speech(response, call_uuid)
 
                 if audio_path:
                     logger.info(f"Generated audio at {audio_path}")
                 else:
                     logger.error("Failed to generate speech from response")
-            else:
-                logger.error("Failed to get LLM response")
+                return response, intent
+
+            if speech:
+                speech.cancel()
+            logger.error("Failed to get LLM response")
 
         except Exception as e:
             logger.error(f"Error handling transcription: {e}")
+        return None, "none"
 
     async def run(self):
         """Run the support agent."""
@@ -127,8 +154,7 @@ class Conversational_IVR:
             logger.error(f"Error running support agent: {e}")
 
 def main():
-    """Main entry point."""
-    agent = Conversational_IVR()
+    """Main entry point (runs the shared module-level agent)."""
     asyncio.run(agent.run())
 
 
@@ -144,6 +170,7 @@ async def startup_event():
     ok = await agent.initialize()
     if not ok:
         logger.error("Conversational_IVR failed to initialize at startup")
+    await agent.llm_client.warm_up()
 
 
 @app.on_event("shutdown")
@@ -159,7 +186,7 @@ async def shutdown_event():
     
     try:
         if hasattr(agent, 'tts_client') and agent.tts_client:
-            # Add any TTS client cleanup if needed
+            agent.tts_client.close()
             logger.info("TTS client cleaned up")
     except Exception as e:
         logger.error(f"Error during TTS client cleanup: {str(e)}")
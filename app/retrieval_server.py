@@ -0,0 +1,47 @@
+"""
+Retrieval sidecar: hosts the embedding model, re-ranker and ChromaDB collection
+once per machine so every API worker shares them instead of loading its own copy.
+
+Run with:
+    uvicorn app.retrieval_server:app --uds /tmp/ivr_retrieval.sock
+and set `retrieval_socket` in app/config.py to the same path.
+"""
+import asyncio
+import logging
+from fastapi import FastAPI
+from fastapi.responses import ORJSONResponse
+from pydantic import BaseModel
+
+from app import retriever
+
+logger = logging.getLogger(__name__)
+
+app = FastAPI(default_response_class=ORJSONResponse)
+
+
+class RetrievalRequest(BaseModel):
+    query: str
+    initial_results: int = 10
+    final_results: int = 1
+
+
+@app.on_event("startup")
+async def startup_event():
+    """Load and warm the RAG models before accepting requests."""
+    # This process runs nothing but retrieval, so its torch pool can be split
+    retriever.split_torch_threads()
+    if await asyncio.to_thread(retriever.load_rag_resources):
+        await retriever.warm_up()
+    else:
+        logger.error("Retrieval sidecar started without RAG resources")
+
+
+@app.post("/retrieve")
+async def retrieve(request: RetrievalRequest):
+    """Return the re-ranked KB context for a query."""
+    context = await retriever.retrieve_context(
+        request.query,
+        initial_results=request.initial_results,
+        final_results=request.final_results
+    )
+    return {"context": context}
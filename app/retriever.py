@@ -0,0 +1,493 @@
+"""
+Two-stage KB retrieval (bi-encoder + Chroma HNSW, then cross-encoder re-rank).
+
+Used in-process by LLMClient, or hosted once per machine by
+app.retrieval_server so several API workers share one copy of the models.
+"""
+import logging
+import os
+import numpy as np
+import torch
+from app.config import settings
+from sentence_transformers import SentenceTransformer, CrossEncoder
+import chromadb
+import asyncio
+import threading
+import time
+import concurrent.futures
+import functools
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+# Embedding model, re-ranker and ChromaDB collection are loaded lazily, exactly
+# once per process, so importing this module (e.g. in pre-forked workers or
+# tooling) does not pay the model load.
+_rag_lock = threading.Lock()
+_model = None
+_reranker = None
+_collection = None
+_rag_load_failed = False
+
+
+def load_reranker():
+    """Load the cross-encoder, preferring the int8 ONNX export when configured.
+
+    The quantized ONNX file ships with the Hub model; older sentence-transformers
+    (no `backend` argument) or a missing onnxruntime fall back to PyTorch.
+    """
+    name = 'cross-encoder/ms-marco-MiniLM-L-6-v2'
+    if settings.rerank_backend == "onnx":
+        try:
+            reranker = CrossEncoder(
+                name,
+                backend="onnx",
+                model_kwargs={"file_name": settings.rerank_onnx_file}
+            )
+            logger.info(f"? Re-ranker loaded with ONNX backend ({settings.rerank_onnx_file})")
+            return reranker
+        except Exception as e:
+            logger.warning(f"?? ONNX re-ranker unavailable ({e}), using PyTorch")
+    reranker = CrossEncoder(name)
+    if settings.rerank_bettertransformer:
+        try:
+            from optimum.bettertransformer import BetterTransformer
+            reranker.model = BetterTransformer.transform(reranker.model, keep_original_model=False)
+            logger.info("? Re-ranker converted to BetterTransformer")
+        except Exception as e:
+            logger.warning(f"?? BetterTransformer not applied to re-ranker ({e})")
+    return reranker
+
+
+def load_embedder():
+    """Load the query encoder: int8 ONNX when configured, else PyTorch.
+
+    Chroma only stores float32 vectors, so int8 applies to the encoder's
+    weights/matmuls, not to the stored embeddings.
+    """
+    if settings.embed_backend == "onnx":
+        try:
+            model = SentenceTransformer(
+                settings.embed_model,
+                backend="onnx",
+                model_kwargs={"file_name": settings.embed_onnx_file}
+            )
+            logger.info(f"? Embedding model loaded with ONNX backend ({settings.embed_onnx_file})")
+            return model
+        except Exception as e:
+            logger.warning(f"?? ONNX embedding model unavailable ({e}), using PyTorch")
+    model = SentenceTransformer(settings.embed_model)
+    if settings.embed_quantize:
+        if torch.cuda.is_available():
+            model.half()
+        else:
+            model = torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+    return model
+
+
+def load_rag_resources() -> bool:
+    """Load the embedding model, re-ranker and KB collection if not loaded yet.
+
+    Returns:
+        True if all RAG resources are available
+    """
+    global _model, _reranker, _collection, _rag_load_failed
+    if _collection is not None:
+        return True
+    with _rag_lock:
+        if _collection is not None:
+            return True
+        if _rag_load_failed:
+            # Don't retry a multi-second model load on every request
+            return False
+        try:
+            # Embedding model for initial retrieval
+            model = load_embedder()
+
+            # Cross-encoder model for re-ranking
+            reranker = load_reranker()
+
+            client = chromadb.PersistentClient(path="./Data/zenius_db")
+            collection = client.get_collection("zenius_kb")
+        except Exception:
+            logger.exception("? Failed to initialize ChromaDB or embedding model.")
+            _rag_load_failed = True
+            return False
+        _model, _reranker, _collection = model, reranker, collection
+        logger.info("? Zenius KB successfully loaded into memory for RAG retrieval.")
+        logger.info("? Re-ranker model loaded successfully.")
+        return True
+
+
+def get_model():
+    """Return the query embedding model, loading it on first use."""
+    if _model is None and not load_rag_resources():
+        raise RuntimeError("Embedding model is not available")
+    return _model
+
+
+def get_reranker():
+    """Return the cross-encoder re-ranker, loading it on first use."""
+    if _reranker is None and not load_rag_resources():
+        raise RuntimeError("Re-ranker is not available")
+    return _reranker
+
+
+def get_collection():
+    """Return the KB collection, loading it on first use."""
+    if _collection is None and not load_rag_resources():
+        raise RuntimeError("KB collection is not available")
+    return _collection
+
+
+# One worker keeps the encoder (and any CUDA context) hot on a single thread
+_EMBED_EXECUTOR = concurrent.futures.ThreadPoolExecutor(max_workers=1, thread_name_prefix="embed")
+
+# Chroma queries and cross-encoder passes for concurrent calls run here so they
+# never block the event loop
+_RAG_WORKERS = settings.rag_workers or min(4, os.cpu_count() or 1)
+
+_RAG_EXECUTOR = concurrent.futures.ThreadPoolExecutor(
+    max_workers=_RAG_WORKERS,
+    thread_name_prefix="rag"
+)
+
+_TORCH_THREADS = int(os.environ.get("TORCH_NUM_THREADS", os.cpu_count() or 1))
+
+
+def split_torch_threads():
+    """Split the TORCH_NUM_THREADS budget across the retrieval threads.
+
+    Torch's intra-op pool is process-wide, so this is only called by the
+    retrieval sidecar, where the RAG workers plus the embed thread are the only
+    forward passes. The API process leaves its pool alone, since Coqui TTS
+    synthesis runs there too.
+    """
+    torch.set_num_threads(max(1, _TORCH_THREADS // (_RAG_WORKERS + 1)))
+
+
+def _inference(fn, *args, **kwargs):
+    """Call a model method with autograd (and its version counters) disabled."""
+    with torch.inference_mode():
+        return fn(*args, **kwargs)
+
+
+def rerank_scores(pairs, **kwargs) -> np.ndarray:
+    """Score (query, doc) pairs with the cross-encoder.
+
+    Args:
+        pairs: List of [query, document] pairs
+        **kwargs: Extra CrossEncoder.predict() arguments
+
+    Returns:
+        float32 array of relevance scores, one per pair
+    """
+    reranker = get_reranker()
+    if settings.rerank_bf16 and settings.rerank_backend != "onnx" and not torch.cuda.is_available():
+        # bf16 logits can't go straight to numpy: take the tensor and upcast
+        with torch.inference_mode(), torch.autocast("cpu", dtype=torch.bfloat16):
+            scores = reranker.predict(pairs, convert_to_tensor=True, **kwargs)
+        return scores.float().cpu().numpy()
+    return _inference(reranker.predict, pairs, **kwargs)
+
+
+class QueryEncoder:
+    """Encode queries off the event loop, coalescing concurrent requests.
+
+    Queries arriving within `window` seconds of each other are encoded in a
+    single model.encode() call (one GEMM instead of N small ones).
+    """
+
+    def __init__(self, window: float = 0.005, max_batch: int = 32):
+        self.window = window
+        self.max_batch = max_batch
+        self._pending = []
+        self._flush_handle = None
+
+    async def encode(self, text: str):
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((text, future))
+        if len(self._pending) >= self.max_batch:
+            self._flush()
+        elif self._flush_handle is None:
+            self._flush_handle = loop.call_later(self.window, self._flush)
+        return await future
+
+    def _flush(self):
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        batch, self._pending = self._pending, []
+        if batch:
+            asyncio.get_running_loop().create_task(self._encode_batch(batch))
+
+    async def _encode_batch(self, batch):
+        texts = [text for text, _ in batch]
+        try:
+            embeddings = await asyncio.get_running_loop().run_in_executor(
+                _EMBED_EXECUTOR,
+                functools.partial(
+                    _inference, get_model().encode, texts,
+                    batch_size=self.max_batch,
+                    convert_to_numpy=True,
+                    normalize_embeddings=True,
+                ),
+            )
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for (_, future), embedding in zip(batch, embeddings):
+            if not future.done():
+                future.set_result(embedding)
+
+
+query_encoder = QueryEncoder()
+
+
+class TTLCache:
+    """Small LRU cache whose entries also expire after `ttl` seconds."""
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+
+    def get(self, key):
+        item = self._data.get(key)
+        if item is None:
+            return None
+        value, expires = item
+        if expires < time.monotonic():
+            del self._data[key]
+            return None
+        self._data.move_to_end(key)
+        return value
+
+    def put(self, key, value, expires=None):
+        # expires: absolute monotonic deadline, for values that are already aged
+        self._data[key] = (value, expires if expires is not None else time.monotonic() + self.ttl)
+        self._data.move_to_end(key)
+        if len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+
+class SemanticCache:
+    """LRU cache keyed by normalized query embeddings.
+
+    A lookup is one matrix-vector product against all cached embeddings; the
+    best match is reused when its cosine similarity reaches `threshold`, so
+    paraphrases ("what do you charge" / "what are your charges") share an entry.
+    Slots expire `ttl` seconds after they are created, like TTLCache entries,
+    so a rebuilt KB is picked up; `maxsize` 0 disables the cache.
+    """
+
+    def __init__(self, maxsize: int, threshold: float, ttl: float):
+        self.maxsize = max(0, maxsize)
+        self.threshold = threshold
+        self.ttl = ttl
+        self._embeddings = None  # (maxsize, dim) float32, allocated on first add
+        self._values = [None] * self.maxsize
+        self._expires = np.zeros(self.maxsize, dtype=np.float64)
+        self._last_used = np.zeros(self.maxsize, dtype=np.int64)
+        self._size = 0
+        self._tick = 0
+
+    def _match(self, embedding: np.ndarray):
+        # Closest slot at or above the threshold, or None
+        if self._size == 0:
+            return None
+        sims = self._embeddings[:self._size] @ embedding
+        idx = int(sims.argmax())
+        return idx if sims[idx] >= self.threshold else None
+
+    def get(self, embedding: np.ndarray, tag):
+        """Return (value, expiry) stored under `tag` for the closest cached query, or None."""
+        idx = self._match(embedding)
+        if idx is None or self._expires[idx] < time.monotonic():
+            return None
+        value = self._values[idx].get(tag)
+        if value is None:
+            return None
+        self._tick += 1
+        self._last_used[idx] = self._tick
+        return value, float(self._expires[idx])
+
+    def put(self, embedding: np.ndarray, tag, value):
+        """Store `value` under `tag`, reusing the slot of an equivalent cached query."""
+        if self.maxsize == 0:
+            return
+        if self._embeddings is None:
+            self._embeddings = np.empty((self.maxsize, embedding.shape[0]), dtype=np.float32)
+        now = time.monotonic()
+        idx = self._match(embedding)
+        if idx is not None and self._expires[idx] < now:
+            # Expired equivalent: start the slot over with a fresh TTL
+            self._values[idx] = {}
+            self._expires[idx] = now + self.ttl
+        if idx is None:
+            if self._size < self.maxsize:
+                idx = self._size
+                self._size += 1
+            else:
+                # Evict the least recently used entry
+                idx = int(self._last_used.argmin())
+            self._embeddings[idx] = embedding
+            self._values[idx] = {}
+            self._expires[idx] = now + self.ttl
+        self._values[idx][tag] = value
+        self._tick += 1
+        self._last_used[idx] = self._tick
+
+
+# IVR callers repeat short phrases ("talk to sales", "pricing"); cache the
+# final re-ranked context per normalized query
+_context_cache = TTLCache(settings.context_cache_size, settings.context_cache_ttl)
+# Falls back to near-duplicate matching once the exact key misses
+_semantic_cache = SemanticCache(
+    settings.semantic_cache_size, settings.semantic_cache_threshold, settings.context_cache_ttl
+)
+
+
+async def warm_up():
+    """Run one embedding, KB query and re-rank pass so the first caller
+    does not pay tokenizer setup, first-touch allocations or cold HNSW pages.
+    """
+    try:
+        loop = asyncio.get_running_loop()
+        embedding = np.asarray(await query_encoder.encode("warmup"), dtype=np.float32)
+        await loop.run_in_executor(
+            _RAG_EXECUTOR,
+            functools.partial(
+                get_collection().query,
+                query_embeddings=embedding.reshape(1, -1),
+                n_results=1,
+                include=["documents"]
+            )
+        )
+        await loop.run_in_executor(
+            _RAG_EXECUTOR,
+            functools.partial(
+                rerank_scores,
+                [["warmup query", "warmup doc"]],
+                show_progress_bar=False
+            )
+        )
+        logger.info("?? RAG models warmed up")
+    except Exception as e:
+        logger.warning(f"RAG warm-up failed: {e}")
+
+async def retrieve_context(user_query: str, initial_results: int = 10, final_results: int = 1) -> str:
+    """
+    Retrieve top relevant KB chunks using two-stage retrieval:
+    1. Retrieve top-N chunks using semantic similarity (embedding)
+    2. Re-rank using cross-encoder and return top-K
+
+    Args:
+        user_query: The user's query string
+        initial_results: Number of chunks to retrieve initially (default: 10)
+        final_results: Number of top chunks to return after re-ranking (default: 1)
+
+    Returns:
+        Concatenated context string from top re-ranked chunks
+    """
+    cache_key = (" ".join(user_query.lower().split()), initial_results, final_results)
+    cached = _context_cache.get(cache_key)
+    if cached is not None:
+        logger.info("?? KB context cache hit for query: %s", user_query)
+        return cached
+
+    try:
+        logger.info("?? Retrieving KB context for query: %s", user_query)
+
+        # Stage 1: Initial retrieval using embeddings (top-10)
+        query_embedding = np.asarray(await query_encoder.encode(user_query), dtype=np.float32)
+
+        # Near-duplicate of a recent query: reuse its re-ranked context
+        cache_tag = (initial_results, final_results)
+        cached = _semantic_cache.get(query_embedding, cache_tag)
+        if cached is not None:
+            context, expires = cached
+            logger.info("?? KB context semantic cache hit for query: %s", user_query)
+            # Keeps the slot's deadline, so a hit never extends a context's lifetime
+            _context_cache.put(cache_key, context, expires)
+            return context
+
+        # Hand Chroma the (1, dim) float32 array directly instead of a Python
+        # list, and skip distances/metadatas we never read
+        loop = asyncio.get_running_loop()
+        results = await loop.run_in_executor(
+            _RAG_EXECUTOR,
+            functools.partial(
+                get_collection().query,
+                query_embeddings=query_embedding.reshape(1, -1),
+                n_results=initial_results,
+                include=["documents"]
+            )
+        )
+
+        if not results or not results["documents"] or not results["documents"][0]:
+            logger.warning("?? No KB context found for this query.")
+            _context_cache.put(cache_key, "")
+            _semantic_cache.put(query_embedding, cache_tag, "")
+            return ""
+
+        # Duplicate KB entries (e.g. repeated FAQ answers) would each cost a
+        # cross-encoder pass for the same score: keep the first occurrence only
+        docs = list(dict.fromkeys(results["documents"][0]))
+        logger.info("?? Retrieved %d initial KB chunks (%d unique)",
+                    len(results["documents"][0]), len(docs))
+
+        # Stage 2: Re-ranking using cross-encoder
+        if len(docs) > 0:
+            # Create query-document pairs for re-ranking, longest first so
+            # each mini-batch is padded only to similar-length docs
+            order = np.argsort([-len(doc) for doc in docs], kind="stable")
+            pairs = [[user_query, docs[i]] for i in order]
+
+            # Get re-ranking scores, then undo the length sort
+            sorted_scores = await loop.run_in_executor(
+                _RAG_EXECUTOR,
+                functools.partial(
+                    rerank_scores,
+                    pairs,
+                    batch_size=settings.rerank_batch_size,
+                    show_progress_bar=False
+                )
+            )
+            scores = np.empty_like(sorted_scores)
+            scores[order] = sorted_scores
+
+            # Select top-K documents after re-ranking: O(n) partition, then
+            # sort only the K survivors (descending). final_results comes from
+            # clients too; K <= 0 selects nothing (argpartition(-0)[-0:] would be all)
+            k = max(0, min(final_results, len(scores)))
+            if k == 0:
+                top_idx = np.arange(0)
+            elif k < len(scores):
+                top_idx = np.argpartition(scores, -k)[-k:]
+            else:
+                top_idx = np.arange(k)
+            top_idx = top_idx[np.argsort(scores[top_idx])[::-1]]
+            top_docs = [docs[idx] for idx in top_idx]
+
+            logger.info("?? Re-ranked and selected top-%d chunk(s)", final_results)
+            # Scores and context previews are only built when DEBUG is on
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug("Top re-ranking scores: %s", sorted(scores, reverse=True)[:final_results])
+                for i, doc in enumerate(top_docs, 1):
+                    preview = doc[:200] + '...' if len(doc) > 200 else doc
+                    logger.debug("   Context chunk %d: %s", i, preview)
+
+            context = "\n\n".join(top_docs)
+            _context_cache.put(cache_key, context)
+            _semantic_cache.put(query_embedding, cache_tag, context)
+            return context
+
+        return ""
+
+    except Exception:
+        logger.exception("Error retrieving KB context.")
+        return ""
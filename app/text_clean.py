@@ -0,0 +1,95 @@
+"""
+Single-pass TTS text cleaner over UTF-8 bytes, compiled with Numba when installed.
+"""
+import numpy as np
+
+try:
+    from numba import njit
+except ImportError:  # numba is optional; callers fall back to the regex cleaner
+    njit = None
+
+_OPEN_TAG = np.frombuffer(b"<intent>", dtype=np.uint8)
+_CLOSE_TAG = np.frombuffer(b"</intent>", dtype=np.uint8)
+
+
+def _matches_at(buf: np.ndarray, i: int, tag: np.ndarray) -> bool:
+    if i + tag.size > buf.size:
+        return False
+    for k in range(tag.size):
+        if buf[i + k] != tag[k]:
+            return False
+    return True
+
+
+def _is_space(b: int) -> bool:
+    # ASCII bytes matched by re's \s for str patterns (incl. \x1c-\x1f), and
+    # every non-ASCII byte, which the regex cleaner also turns into a space
+    return b == 32 or 9 <= b <= 13 or 28 <= b <= 31 or b >= 128
+
+
+def _clean_bytes(buf: np.ndarray, open_tag: np.ndarray, close_tag: np.ndarray) -> np.ndarray:
+    """Strip <intent>...</intent>, map non-ASCII to spaces and collapse whitespace.
+
+    Same result as the regex cleaner in tts_client (tags do not span newlines,
+    runs of tags alone vanish, other runs become one space, ends are
+    stripped), written into one output buffer of the input's length.
+
+    Args:
+        buf: UTF-8 encoded text as a uint8 array
+        open_tag: b"<intent>" as a uint8 array
+        close_tag: b"</intent>" as a uint8 array
+
+    Returns:
+        np.ndarray: Cleaned ASCII bytes
+    """
+    n = buf.size
+    out = np.empty(n, dtype=np.uint8)
+    length = 0
+    pending_space = False
+    i = 0
+    while i < n:
+        b = buf[i]
+        if b == 60 and _matches_at(buf, i, open_tag):
+            # Lazy match for the closing tag, not crossing a newline
+            j = i + open_tag.size
+            end = -1
+            while j < n and buf[j] != 10:
+                if buf[j] == 60 and _matches_at(buf, j, close_tag):
+                    end = j + close_tag.size
+                    break
+                j += 1
+            if end >= 0:
+                i = end
+                continue
+        if _is_space(b):
+            pending_space = True
+        else:
+            if pending_space and length > 0:
+                out[length] = 32
+                length += 1
+            pending_space = False
+            out[length] = b
+            length += 1
+        i += 1
+    return out[:length]
+
+
+if njit is not None:
+    _matches_at = njit(cache=True)(_matches_at)
+    _is_space = njit(cache=True)(_is_space)
+    _clean_bytes = njit(cache=True)(_clean_bytes)
+
+NUMBA_AVAILABLE = njit is not None
+
+
+def clean_text(text: str) -> str:
+    """Clean text for TTS with the compiled byte-level state machine.
+
+    Args:
+        text: Raw LLM reply
+
+    Returns:
+        str: Text without intent tags or non-ASCII characters, whitespace collapsed
+    """
+    buf = np.frombuffer(text.encode("utf-8", "surrogatepass"), dtype=np.uint8)
+    return _clean_bytes(buf, _OPEN_TAG, _CLOSE_TAG).tobytes().decode("ascii")
@@ -3,13 +3,72 @@ Coqui TTS client for text-to-speech conversion.
 """
 import os
 import time
-from typing import Optional
+import asyncio
+import concurrent.futures
+import errno
+import hashlib
+import heapq
+import shutil
+import uuid as uuid_lib
+from collections import OrderedDict, defaultdict
+import itertools
+import multiprocessing as mp
+import queue
+import threading
+from functools import lru_cache
+from math import gcd
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+import numpy as np
+import soundfile as sf
+from scipy.signal import firwin, resample_poly
+import torch
 from TTS.api import TTS 
+from TTS.utils.manage import ModelManager
 import logging
 import re
 
+from app.config import settings
+from app.text_clean import NUMBA_AVAILABLE, clean_text as _compiled_clean_text
+
 logger = logging.getLogger(__name__)
 
+# Text-cleaning patterns, compiled once at import
+_INTENT_RE = re.compile(r'<intent>.*?</intent>')
+_NON_ASCII_RE = re.compile(r'[^\x00-\x7F]+')
+_SPECIAL_RE = re.compile(r'[^\w\s.,!?\-]')
+_WS_RE = re.compile(r'\s+')
+# Fallback sentence split on periods/newlines: newline -> period, then str.split
+_NL2DOT = str.maketrans({'\n': '.'})
+# One-pass cleaner: group 1 is a run of intent tags only (dropped), group 2 a
+# run of whitespace/non-ASCII, possibly spanning tags (one space)
+_CLEAN_RE = re.compile(r'((?:<intent>.*?</intent>)+)|((?:\s|[^\x00-\x7F]|<intent>.*?</intent>)+)')
+_SENTENCE_END_RE = re.compile(r'(?<=[.!?])\s+')
+
+# Silence (in samples) Coqui's Synthesizer.tts appends after every sentence,
+# split or not; only the ONNX path has to add it itself
+_SENTENCE_GAP = 10000
+
+
+@lru_cache(maxsize=4)
+def _resample_filter(up: int, down: int) -> np.ndarray:
+    """Anti-aliasing FIR for resample_poly (its default design), built once per ratio."""
+    max_rate = max(up, down)
+    return firwin(2 * 10 * max_rate + 1, 1.0 / max_rate, window=("kaiser", 5.0))
+
+
+def _clean_repl(m: "re.Match") -> str:
+    return '' if m.group(1) else ' '
+
+
+def _strip_non_ascii(text: str) -> str:
+    """Replace each run of non-ASCII characters with a single space.
+
+    `str.isascii()` is an O(1) flag check on CPython strings, so the common
+    all-ASCII reply skips the regex scan entirely.
+    """
+    return text if text.isascii() else _NON_ASCII_RE.sub(' ', text)
+
+
 class TTSClient:
     def __init__(self, model_name: str = "tts_models/en/ljspeech/glow-tts", output_dir: str = "/tmp/tts"):
         """Initialize TTS client.
@@ -21,44 +80,380 @@ class TTSClient:
         self.model_name = model_name
         self.output_dir = output_dir
         self.tts = None
+        self.device = "cpu"
+        self.worker: Optional["TTSWorker"] = None
+        self.onnx = False  # Synthesizing through an ONNX Runtime session
         self.initialized = False
+
+        # Latest generated response per call UUID as (path, mtime, size_bytes),
+        # so the API layer can serve it without scanning or stat-ing output_dir
+        self.latest_by_uuid: Dict[str, Tuple[str, float, int]] = {}
+        self._index_lock = asyncio.Lock()
+        # Response files on disk per call UUID (numbers the next response file);
+        # decremented as cleanup removes them and dropped at zero
+        self._response_counts: Dict[str, int] = defaultdict(int)
+        # Min-heap of (mtime, path) for response WAVs in output_dir, so cleanup
+        # only touches files that have actually expired
+        self._file_heap: List[Tuple[float, str]] = []
+
+        # Coqui models are not thread-safe: streamed segments are synthesized in
+        # order on one dedicated thread, off the event loop
+        self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=1, thread_name_prefix="tts")
         
         # Create output directory if it doesn't exist
         os.makedirs(output_dir, exist_ok=True)
 
-    async def initialize(self):
-        """Initialize the TTS model with optimized settings."""
-        try:
-            # Initialize the TTS model first
-            self.tts = TTS(
-                model_name=self.model_name,
-                progress_bar=False,
-                gpu=False  # Set to True if you have a CUDA-capable GPU
+        # Content-addressed WAV cache for repeated prompts ("Please hold", ...),
+        # LRU-ordered by last use and seeded from disk (oldest first)
+        self.cache_dir = os.path.join(output_dir, "cache")
+        os.makedirs(self.cache_dir, exist_ok=True)
+        self._cache_lru: "OrderedDict[str, None]" = OrderedDict()
+        with os.scandir(self.cache_dir) as entries:
+            cached = sorted(
+                (entry.stat().st_mtime, entry.path) for entry in entries
+                if entry.name.endswith(".wav") and ".tmp" not in entry.name
             )
-            
-            # Warm up the model with a short phrase
-            warmup_path = os.path.join(self.output_dir, "warmup.wav")
-            self.tts.tts_to_file(
-                text="Hello, I'm initializing.",
-                file_path=warmup_path,
-                speaker_wav=None
+        for _, path in cached:
+            self._cache_lru[path] = None
+
+    def _build_tts(self) -> TTS:
+        """Construct the Coqui TTS object, pairing it with settings.tts_vocoder.
+
+        TTS() only accepts a vocoder by path, so both models are resolved
+        (and downloaded on first use) through Coqui's ModelManager.
+        """
+        if not settings.tts_vocoder:
+            return TTS(model_name=self.model_name, progress_bar=False)
+        manager = ModelManager(progress_bar=False)
+        model_path, config_path, _ = manager.download_model(self.model_name)
+        vocoder_path, vocoder_config_path, _ = manager.download_model(settings.tts_vocoder)
+        return TTS(
+            model_path=model_path,
+            config_path=config_path,
+            vocoder_path=vocoder_path,
+            vocoder_config_path=vocoder_config_path,
+            progress_bar=False
+        )
+
+    def _quantize(self):
+        """Dynamic int8 quantization of the CPU TTS model and vocoder.
+
+        Only Linear/LSTM/GRU weights are converted; convolutions stay fp32.
+        """
+        synthesizer = self.tts.synthesizer
+        layers = {torch.nn.Linear, torch.nn.LSTM, torch.nn.GRU}
+        synthesizer.tts_model = torch.quantization.quantize_dynamic(
+            synthesizer.tts_model, layers, dtype=torch.qint8
+        )
+        if synthesizer.vocoder_model is not None:
+            synthesizer.vocoder_model = torch.quantization.quantize_dynamic(
+                synthesizer.vocoder_model, layers, dtype=torch.qint8
             )
-            
-            # Clean up the warmup file
+
+    def _compile(self):
+        """torch.compile the TTS model and vocoder inference paths.
+
+        Coqui calls ``.inference()`` rather than ``forward()``, so those bound
+        methods are compiled. Inductor's FX graph cache is persisted under
+        settings.tts_compile_cache_dir so restarts skip most recompilation.
+        """
+        os.environ.setdefault("TORCHINDUCTOR_CACHE_DIR", settings.tts_compile_cache_dir)
+        import torch._inductor.config as inductor_config
+        inductor_config.fx_graph_cache = True
+
+        # CUDA graphs only pay off (and only apply) on the GPU
+        mode = "reduce-overhead" if self.device == "cuda" else "default"
+        synthesizer = self.tts.synthesizer
+        for model in (synthesizer.tts_model, synthesizer.vocoder_model):
+            if model is not None:
+                model.inference = torch.compile(model.inference, mode=mode, dynamic=True)
+
+    def _load_onnx(self) -> bool:
+        """Serve the TTS model through ONNX Runtime (int8) instead of PyTorch.
+
+        Uses Coqui's own ONNX support (VITS models): the model is exported and
+        int8-quantized to settings.tts_onnx_path on first use, then loaded on
+        the CUDA or CPU execution provider.
+
+        Returns:
+            True if the ONNX session is active, False to keep the PyTorch path
+        """
+        model = self.tts.synthesizer.tts_model
+        if not hasattr(model, "inference_onnx"):
+            logger.warning(f"{self.model_name} has no ONNX export, using PyTorch for TTS")
+            return False
+        path = settings.tts_onnx_path
+        if not os.path.exists(path):
+            from onnxruntime.quantization import QuantType, quantize_dynamic
+            fp32_path = f"{path}.fp32"
+            model.export_onnx(output_path=fp32_path, verbose=False)
+            quantize_dynamic(fp32_path, path, weight_type=QuantType.QInt8)
+            os.remove(fp32_path)
+            logger.info(f"Exported int8 ONNX TTS model to {path}")
+        model.load_onnx(path, cuda=self.device == "cuda")
+        self.onnx = True
+        return True
+
+    def _onnx_tts(self, text: str) -> np.ndarray:
+        """Synthesize one sentence with the ONNX Runtime session."""
+        model = self.tts.synthesizer.tts_model
+        ids = np.asarray([model.tokenizer.text_to_ids(text)], dtype=np.int64)
+        return np.asarray(model.inference_onnx(ids), dtype=np.float32).reshape(-1)
+
+    def _cache_phonemes(self):
+        """Memoize the model tokenizer's text_to_ids (G2P via eSpeak) per sentence.
+
+        Synthesis runs sentence by sentence, so recurring sentences (greetings,
+        menu prompts, error messages) skip phonemization. The LRU is bounded
+        by settings.tts_phoneme_cache_size and pre-filled from
+        settings.tts_known_prompts.
+        """
+        tokenizer = getattr(self.tts.synthesizer.tts_model, "tokenizer", None)
+        if tokenizer is None or settings.tts_phoneme_cache_size <= 0:
+            return
+        text_to_ids = tokenizer.text_to_ids
+        cache: "OrderedDict[Tuple[str, Optional[str]], List[int]]" = OrderedDict()
+
+        def cached_text_to_ids(text: str, language: Optional[str] = None) -> List[int]:
+            key = (text, language)
+            ids = cache.get(key)
+            if ids is None:
+                ids = cache[key] = text_to_ids(text, language=language)
+                if len(cache) > settings.tts_phoneme_cache_size:
+                    cache.popitem(last=False)
+            else:
+                cache.move_to_end(key)
+            return list(ids)
+
+        tokenizer.text_to_ids = cached_text_to_ids
+        for prompt in settings.tts_known_prompts:
+            for sentence in _SENTENCE_END_RE.split(self._clean_text_for_tts(prompt)):
+                if sentence:
+                    cached_text_to_ids(sentence)
+
+    def _load_model(self):
+        """Load the TTS model (on the GPU when one is usable) and warm it up.
+
+        Raises:
+            Exception: If the model cannot be loaded or synthesize
+        """
+        self.tts = None
+        if settings.tts_use_gpu and torch.cuda.is_available():
             try:
-                if os.path.exists(warmup_path):
-                    os.remove(warmup_path)
+                self.tts = self._build_tts().to("cuda")
+                self.device = "cuda"
             except Exception as e:
-                logger.warning(f"Could not remove warmup file: {e}")
+                logger.warning(f"CUDA TTS init failed, falling back to CPU: {e}")
+                self.tts = None
+        if self.tts is None:
+            self.tts = self._build_tts()
+            self.device = "cpu"
+        self._cache_phonemes()
+        if settings.tts_onnx_path and self._load_onnx():
+            pass
+        else:
+            if self.device == "cpu" and settings.tts_quantize:
+                self._quantize()
+            if settings.tts_compile:
+                self._compile()
+        
+        # Warm up the model with a short phrase
+        warmup_path = os.path.join(self.output_dir, "warmup.wav")
+        self._synthesize_to_file("Hello, I'm initializing.", warmup_path)
+        
+        # Clean up the warmup file
+        try:
+            if os.path.exists(warmup_path):
+                os.remove(warmup_path)
+        except Exception as e:
+            logger.warning(f"Could not remove warmup file: {e}")
+
+    async def initialize(self):
+        """Initialize the TTS model with optimized settings."""
+        try:
+            if settings.tts_worker_process:
+                # Model lives in a long-lived worker process; load it there once
+                self.worker = TTSWorker(self.model_name, self.output_dir)
+                if not await asyncio.get_running_loop().run_in_executor(None, self.worker.start):
+                    raise RuntimeError("TTS worker process failed to start")
+                self.device = "worker"
+            else:
+                self._load_model()
+
+            # Seed the cleanup heap with responses left from a previous run
+            # (the cache/ subdirectory is managed by its own LRU)
+            with os.scandir(self.output_dir) as entries:
+                self._file_heap = [
+                    (entry.stat().st_mtime, entry.path) for entry in entries
+                    if entry.name.endswith('.wav') and entry.is_file()
+                ]
+            heapq.heapify(self._file_heap)
                 
             self.initialized = True
-            logger.info(f"Successfully initialized TTS model: {self.model_name}")
+            logger.info(f"Successfully initialized TTS model: {self.model_name} on {self.device}")
             return True
         except Exception as e:
             logger.error(f"Error initializing TTS model: {e}", exc_info=True)
             self.initialized = False
             return False
 
+    def _cache_path(self, text: str) -> str:
+        """Cache file for a cleaned text (keyed on model, vocoder, output settings and text)."""
+        key = f"{self.model_name}\0{settings.tts_vocoder}\0{settings.tts_quantize}\0{settings.tts_sample_rate}\0{settings.tts_onnx_path}\0{text}"
+        digest = hashlib.blake2b(key.encode(), digest_size=16).hexdigest()
+        return os.path.join(self.cache_dir, digest + ".wav")
+
+    @staticmethod
+    def _link(src: str, dst: str):
+        """Hardlink src to dst (copy if the filesystem can't link).
+
+        The link (or copy) is made under a temporary name and renamed over
+        dst, so an existing dst, which may itself be a hardlink to another
+        cache entry, is replaced rather than written through.
+        """
+        tmp = f"{dst}.{uuid_lib.uuid4().hex}.tmp"
+        try:
+            try:
+                os.link(src, tmp)
+            except OSError as e:
+                if e.errno not in (errno.EXDEV, errno.EPERM):
+                    raise
+                shutil.copyfile(src, tmp)
+            # A link shares the cached inode's old mtime; refresh it so age-based
+            # cleanup and newest-file lookups treat this as a fresh response
+            os.utime(tmp, None)
+            os.replace(tmp, dst)
+        except BaseException:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            raise
+
+    async def _render(self, text: str, output_path: str):
+        """Synthesize text to output_path, reusing a cached WAV when possible.
+
+        Misses are synthesized (in the worker process when enabled) into the
+        cache first, then linked to output_path. Only whole-reply renders
+        (generate_speech) go through the cache; SpeechStream synthesizes the
+        streamed reply sentence by sentence and bypasses it.
+
+        Raises:
+            Exception: If synthesis fails
+        """
+        cache_path = self._cache_path(text)
+        if cache_path in self._cache_lru and os.path.exists(cache_path):
+            self._cache_lru.move_to_end(cache_path)
+            self._link(cache_path, output_path)
+            logger.debug(f"TTS cache hit: {os.path.basename(cache_path)}")
+            return
+
+        # Write under a temporary name so a concurrent reader never sees a partial file
+        tmp_path = f"{cache_path[:-4]}.{uuid_lib.uuid4().hex}.tmp.wav"
+        try:
+            if self.worker is not None:
+                await asyncio.wrap_future(self.worker.submit(text, tmp_path))
+            else:
+                # Off the event loop on the TTS thread; torch releases the GIL
+                # inside its kernels, so other calls keep being served
+                await asyncio.get_running_loop().run_in_executor(
+                    self._executor, self._synthesize_to_file, text, tmp_path
+                )
+            os.replace(tmp_path, cache_path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        self._link(cache_path, output_path)
+
+        self._cache_lru[cache_path] = None
+        self._cache_lru.move_to_end(cache_path)
+        while len(self._cache_lru) > settings.tts_cache_max_files:
+            evicted, _ = self._cache_lru.popitem(last=False)
+            try:
+                os.remove(evicted)
+            except OSError:
+                pass
+
+    def close(self):
+        """Stop the TTS worker process, if one is running."""
+        if self.worker is not None:
+            self.worker.stop()
+            self.worker = None
+
+    def _tts_samples(self, text: str) -> np.ndarray:
+        """Run the synthesizer directly (no autograd; fp16 autocast on CUDA, or ONNX Runtime).
+
+        Multi-sentence text is split once here and every sentence is
+        synthesized under a single inference context with Coqui's own
+        sentence segmenter bypassed. Synthesizer.tts already ends each
+        sentence with its inter-sentence gap, so those waveforms are joined
+        as they are; ONNX output gets the same gap between sentences.
+
+        Args:
+            text: Cleaned text to synthesize
+
+        Returns:
+            np.ndarray: float32 waveform at output_sample_rate
+        """
+        sentences = [s for s in _SENTENCE_END_RE.split(text) if s]
+        synthesizer = self.tts.synthesizer
+        if self.onnx:
+            wavs = [self._onnx_tts(s) for s in sentences]
+        else:
+            with torch.inference_mode():
+                if self.device == "cuda" and settings.tts_fp16:
+                    with torch.autocast("cuda", dtype=torch.float16):
+                        wavs = [synthesizer.tts(text=s, split_sentences=False) for s in sentences]
+                else:
+                    wavs = [synthesizer.tts(text=s, split_sentences=False) for s in sentences]
+        gap = np.zeros(_SENTENCE_GAP, dtype=np.float32)
+        parts = []
+        for wav in wavs:
+            if torch.is_tensor(wav):
+                wav = wav.float().cpu().numpy()
+            if self.onnx and parts:
+                parts.append(gap)
+            parts.append(np.asarray(wav, dtype=np.float32))
+        if not parts:
+            return np.zeros(0, dtype=np.float32)
+        return self._resample(np.concatenate(parts))
+
+    @property
+    def output_sample_rate(self) -> int:
+        """Sample rate of the written WAVs (settings.tts_sample_rate, or native)."""
+        return settings.tts_sample_rate or self.tts.synthesizer.output_sample_rate
+
+    def _resample(self, wav: np.ndarray) -> np.ndarray:
+        """Polyphase-resample from the model's native rate to output_sample_rate."""
+        native = self.tts.synthesizer.output_sample_rate
+        target = self.output_sample_rate
+        if native == target or not wav.size:
+            return wav
+        g = gcd(target, native)
+        up, down = target // g, native // g
+        return resample_poly(wav, up, down, window=_resample_filter(up, down)).astype(np.float32, copy=False)
+
+    @staticmethod
+    def _normalize(wav: np.ndarray) -> np.ndarray:
+        """Peak-normalise a waveform to int16 PCM like Coqui's save_wav."""
+        peak = max(0.01, float(np.max(np.abs(wav)))) if wav.size else 1.0
+        pcm = wav * (32767 / peak)
+        np.clip(pcm, -32768, 32767, out=pcm)
+        return pcm.astype(np.int16, copy=False)
+
+    def _write_wav(self, output_path: str, wav: np.ndarray):
+        """Write a waveform as 16-bit PCM, peak-normalised like Coqui's save_wav.
+
+        The samples are converted to int16 once up front, so libsndfile copies
+        them through unchanged, and the file is written through a 1 MiB buffer.
+        """
+        pcm = self._normalize(wav)
+        with open(output_path, "wb", buffering=1 << 20) as f:
+            sf.write(f, pcm, self.output_sample_rate, subtype="PCM_16", format="WAV")
+
+    def _synthesize_to_file(self, text: str, output_path: str):
+        """Synthesize text straight to a WAV file."""
+        self._write_wav(output_path, self._tts_samples(text))
+
     def _sanitize_text(self, text: str) -> str:
         """Sanitize text by removing special characters and normalizing whitespace.
         
@@ -68,13 +463,12 @@ class TTSClient:
         Returns:
             str: Sanitized text
         """
-        import re
         # Remove non-ASCII characters
-        text = re.sub(r'[^\x00-\x7F]+', ' ', text)
+        text = _strip_non_ascii(text)
         # Remove special characters except basic punctuation
-        text = re.sub(r'[^\w\s.,!?\-]', ' ', text)
+        text = _SPECIAL_RE.sub(' ', text)
         # Normalize whitespace
-        text = re.sub(r'\s+', ' ', text).strip()
+        text = _WS_RE.sub(' ', text).strip()
         return text
 
     def _clean_text_for_tts(self, text: str) -> str:
@@ -86,18 +480,69 @@ class TTSClient:
         Returns:
             str: Cleaned text with intent tags and non-ASCII characters removed
         """
-        import re
-        
-        # First remove intent tags like <intent>sales</intent>
-        cleaned = re.sub(r'<intent>.*?</intent>', '', text)
-        
-        # Then remove non-ASCII characters
-        cleaned = re.sub(r'[^\x00-\x7F]+', ' ', cleaned)
+        # Remove intent tags like <intent>sales</intent> and collapse non-ASCII
+        # characters and whitespace into single spaces, in one pass (a Numba
+        # byte loop when numba is installed, else the compiled regex)
+        if NUMBA_AVAILABLE:
+            return _compiled_clean_text(text)
+        return _CLEAN_RE.sub(_clean_repl, text).strip()
+
+    def _next_output_path(self, uuid: Optional[str]) -> str:
+        """Build the next response file path for a call.
+
+        Args:
+            uuid: Optional call UUID for the file name
+
+        Returns:
+            str: Path like output_dir/response_XX_uuid_timestamp.wav
+        """
+        # Generate new file with timestamp and response counter to prevent overwriting
+        timestamp = int(time.time())
         
-        # Clean up any extra whitespace that might have been left
-        cleaned = re.sub(r'\s+', ' ', cleaned).strip()
+        # Next response number for this UUID from the in-memory counter
+        # (counted by _record_response once the file is written)
+        response_count = self._response_counts.get(uuid, 0) + 1 if uuid else 1
         
-        return cleaned
+        if uuid:
+            file_name = f"response_{response_count:02d}_{uuid}_{timestamp}.wav"
+        else:
+            file_name = f"response_{response_count:02d}_{timestamp}.wav"
+        return os.path.join(self.output_dir, file_name)
+
+    def _synthesize_segment(self, text: str) -> Optional[np.ndarray]:
+        """Synthesize one sentence to float32 samples (runs on the TTS thread).
+
+        Args:
+            text: Sentence from the streamed LLM reply
+
+        Returns:
+            np.ndarray of samples, or None if there is nothing speakable
+        """
+        clean_text = self._clean_text_for_tts(text)
+        if len(clean_text) < 2:
+            return None
+        try:
+            return self._tts_samples(clean_text)
+        except Exception as primary_err:
+            logger.warning(f"Segment TTS generation failed: {primary_err}")
+        safe_text = self._sanitize_text(clean_text)
+        if len(safe_text) >= 3:
+            try:
+                return self._tts_samples(safe_text)
+            except Exception as san_err:
+                logger.warning(f"Sanitized segment TTS generation failed: {san_err}")
+        return None
+
+    def start_stream(self, uuid: Optional[str] = None) -> "SpeechStream":
+        """Start synthesizing a reply sentence by sentence while the LLM streams it.
+
+        Args:
+            uuid: Optional call UUID for the file name
+
+        Returns:
+            SpeechStream: feed() sentences as they arrive, then await finish()
+        """
+        return SpeechStream(self, uuid)
 
     async def generate_speech(self, text: str, uuid: Optional[str] = None) -> Optional[str]:
         """Generate speech from text.
@@ -117,25 +562,7 @@ class TTSClient:
             # Clean up old files first
             await self.cleanup_old_files()
 
-            # Generate new file with timestamp and response counter to prevent overwriting
-            import time
-            timestamp = int(time.time())
-            
-            # Count existing responses for this UUID to get the next number
-            response_count = 0
-            if uuid:
-                # Match files with pattern: response_XX_uuid_*.wav
-                response_count = len([f for f in os.listdir(self.output_dir) 
-                                   if f.startswith(f"response_") and f"_{uuid}_" in f and f.endswith('.wav')])
-            
-            # Increment counter for the new response
-            response_count += 1
-            
-            if uuid:
-                file_name = f"response_{response_count:02d}_{uuid}_{timestamp}.wav"
-            else:
-                file_name = f"response_{response_count:02d}_{timestamp}.wav"
-            output_path = os.path.join(self.output_dir, file_name)
+            output_path = self._next_output_path(uuid)
 
             # Clean the text by removing intent tags before TTS
             clean_text = self._clean_text_for_tts(text)
@@ -144,14 +571,9 @@ class TTSClient:
 
             # Try generating speech with the cleaned text
             try:
-                self.tts.tts_to_file(
-                    text=clean_text,
-                    file_path=output_path,
-                    sample_rate=8000,  # Required sample rate for FreeSWITCH
-                    save_attention=False,
-                    progress_bar=False
-                )
+                await self._render(clean_text, output_path)
                 logger.info(f"Successfully generated speech at {output_path}")
+                await self._record_response(uuid, output_path)
                 return output_path
             except Exception as primary_err:
                 # Primary TTS generation failed. Log and attempt a sanitized fallback.
@@ -161,14 +583,9 @@ class TTSClient:
             try:
                 safe_text = self._sanitize_text(clean_text)
                 if len(safe_text) >= 3:
-                    self.tts.tts_to_file(
-                        text=safe_text,
-                        file_path=output_path,
-                        sample_rate=8000,
-                        save_attention=False,
-                        progress_bar=False
-                    )
+                    await self._render(safe_text, output_path)
                     logger.info(f"Successfully generated speech at {output_path} (sanitized)")
+                    await self._record_response(uuid, output_path)
                     return output_path
             except Exception as san_err:
                 logger.warning(f"Sanitized TTS generation failed: {san_err}")
@@ -176,17 +593,12 @@ class TTSClient:
             # Fallback 2: try joining sentences into a single short paragraph and retry
             try:
                 # Simple sentence splitter on periods/newlines — join into one chunk
-                parts = re.split(r"[\.\n]+", clean_text)
-                joined = ' '.join([p.strip() for p in parts if len(p.strip()) > 3])
+                parts = clean_text.translate(_NL2DOT).split('.')
+                joined = ' '.join([p for p in map(str.strip, parts) if len(p) > 3])
                 if joined and len(joined) >= 3:
-                    self.tts.tts_to_file(
-                        text=joined,
-                        file_path=output_path,
-                        sample_rate=8000,
-                        save_attention=False,
-                        progress_bar=False
-                    )
+                    await self._render(joined, output_path)
                     logger.info(f"Successfully generated speech at {output_path} (joined)")
+                    await self._record_response(uuid, output_path)
                     return output_path
             except Exception as join_err:
                 logger.warning(f"Joined-text TTS generation failed: {join_err}")
@@ -199,46 +611,303 @@ class TTSClient:
             logger.exception(f"Unexpected error generating speech: {e}")
             return None
 
+    async def _record_response(self, uuid: Optional[str], output_path: str):
+        """Track a new response file for cleanup and as the newest for its call UUID."""
+        st = os.stat(output_path)
+        heapq.heappush(self._file_heap, (st.st_mtime, output_path))
+        if uuid:
+            self._response_counts[uuid] += 1
+            async with self._index_lock:
+                self.latest_by_uuid[uuid] = (output_path, st.st_mtime, st.st_size)
+
+    async def _forget_responses(self, removed_paths: set):
+        """Drop index entries that point at deleted files."""
+        if not removed_paths:
+            return
+        async with self._index_lock:
+            for uuid, (path, _, _) in list(self.latest_by_uuid.items()):
+                if path in removed_paths:
+                    del self.latest_by_uuid[uuid]
+
     async def cleanup_old_files(self, max_age_hours: int = 24, max_files: int = 100):
         """Clean up old audio files and enforce maximum file count.
 
+        Pops from the in-memory (mtime, path) heap, so each call costs
+        O(k log N) for the k files actually removed instead of a directory
+        scan and sort.
+
         Args:
             max_age_hours: Maximum age of files to keep in hours
             max_files: Maximum number of files to keep in the directory
         """
         try:
-            current_time = time.time()
-            files = []
-            
-            # First, collect all wav files with their modification times
-            for filename in os.listdir(self.output_dir):
-                if not filename.endswith('.wav'):
+            cutoff = time.time() - max_age_hours * 3600
+            heap = self._file_heap
+            expired = []
+
+            # Files older than max_age_hours, then the oldest ones while there
+            # are still too many
+            while heap and (heap[0][0] < cutoff or len(heap) > max_files):
+                mtime, filepath = heapq.heappop(heap)
+                expired.append((filepath, "old" if mtime < cutoff else "excess"))
+
+            if expired:
+                # Deletes run in the default executor, off the event loop
+                removed = await asyncio.get_running_loop().run_in_executor(None, self._remove_files, expired)
+                self._uncount_responses(removed)
+                await self._forget_responses(removed)
+
+        except Exception as e:
+            logger.error(f"Error during audio file cleanup: {e}", exc_info=True)
+
+    def _uncount_responses(self, removed_paths: set):
+        """Decrement per-UUID response counts for deleted response_XX_uuid_ts.wav files."""
+        for path in removed_paths:
+            parts = os.path.basename(path)[:-4].split('_')
+            if len(parts) < 4 or parts[0] != "response":
+                continue
+            uuid = '_'.join(parts[2:-1])
+            count = self._response_counts.get(uuid, 0) - 1
+            if count > 0:
+                self._response_counts[uuid] = count
+            else:
+                self._response_counts.pop(uuid, None)
+
+    @staticmethod
+    def _remove_files(expired: List[Tuple[str, str]]) -> set:
+        """Delete (path, reason) entries; returns the paths that are now gone."""
+        removed = set()
+        for filepath, reason in expired:
+            try:
+                os.remove(filepath)
+                logger.info(f"Cleaned up {reason} audio file: {os.path.basename(filepath)}")
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                logger.warning(f"Failed to delete {reason} audio file {filepath}: {e}")
+                continue
+            removed.add(filepath)
+        return removed
+
+class SpeechStream:
+    """Sentence-level TTS for a streamed LLM reply.
+
+    Each fed sentence is queued on the TTS thread immediately, so synthesis
+    overlaps with generation of the rest of the reply; finish() appends the
+    segments to a single response WAV for FreeSWITCH as each one completes.
+    """
+
+    def __init__(self, client: TTSClient, uuid: Optional[str] = None):
+        self.client = client
+        self.uuid = uuid
+        self._segments: List[asyncio.Future] = []
+
+    def feed(self, sentence: str):
+        """Queue one complete sentence for synthesis."""
+        # With a worker process the whole reply is rendered there via generate_speech
+        if not self.client.initialized or self.client.worker is not None:
+            return
+        loop = asyncio.get_running_loop()
+        self._segments.append(
+            loop.run_in_executor(self.client._executor, self.client._synthesize_segment, sentence)
+        )
+
+    def cancel(self):
+        """Drop segments that have not started synthesizing yet."""
+        for future in self._segments:
+            future.cancel()
+        self._segments.clear()
+
+    async def finish(self, on_segment: Optional[Callable[[np.ndarray], Awaitable[None]]] = None) -> Optional[str]:
+        """Write segments to one WAV in order, as soon as each is synthesized.
+
+        The file is opened when the first segment is ready and every later
+        segment is appended as it completes, so the write overlaps synthesis
+        of the rest of the reply instead of waiting for all of it. Segments
+        are peak-normalised individually since the overall peak is not known
+        up front.
+
+        Args:
+            on_segment: Optional coroutine given each segment's int16 PCM right
+                after it is written, so the caller can stream it onward
+
+        Returns:
+            str: Path to the generated audio file or None if nothing was synthesized
+        """
+        if not self._segments:
+            return None
+        loop = asyncio.get_running_loop()
+        writer = None
+        output_path = None
+        written = 0
+        try:
+            for future in self._segments:
+                segment = await future
+                if segment is None or not segment.size:
                     continue
-                filepath = os.path.join(self.output_dir, filename)
-                mtime = os.path.getmtime(filepath)
-                files.append((filepath, mtime, current_time - mtime))
-            
-            # Sort by modification time (oldest first)
-            files.sort(key=lambda x: x[1])
-            
-            # Remove files older than max_age_hours
-            for filepath, _, file_age in files:
-                if file_age > (max_age_hours * 3600):
-                    try:
-                        os.remove(filepath)
-                        logger.info(f"Cleaned up old audio file: {os.path.basename(filepath)}")
-                    except OSError as e:
-                        logger.warning(f"Failed to delete old audio file {filepath}: {e}")
-            
-            # If still too many files, remove the oldest ones
-            files = [(f, m) for f, m, _ in files if os.path.exists(f)]  # Refresh file list
-            if len(files) > max_files:
-                for filepath, _ in files[:len(files) - max_files]:
-                    try:
-                        os.remove(filepath)
-                        logger.info(f"Cleaned up excess audio file: {os.path.basename(filepath)}")
-                    except OSError as e:
-                        logger.warning(f"Failed to delete excess audio file {filepath}: {e}")
+                if writer is None:
+                    await self.client.cleanup_old_files()
+                    output_path = self.client._next_output_path(self.uuid)
+                    writer = sf.SoundFile(
+                        output_path, "w",
+                        samplerate=self.client.output_sample_rate,
+                        channels=1, subtype="PCM_16"
+                    )
+                # Off the TTS thread, so the write never queues behind synthesis
+                pcm = self.client._normalize(segment)
+                await loop.run_in_executor(None, writer.write, pcm)
+                if on_segment is not None:
+                    await on_segment(pcm)
+                written += 1
+            if writer is None:
+                return None
+            writer.close()
+            logger.info(f"Successfully generated speech at {output_path} ({written} streamed segments)")
+            await self.client._record_response(self.uuid, output_path)
+            return output_path
+        except Exception as e:
+            logger.exception(f"Unexpected error assembling streamed speech: {e}")
+            self.cancel()
+            if writer is not None:
+                writer.close()
+                if os.path.exists(output_path):
+                    os.remove(output_path)
+            return None
+
 
+def _tts_worker_main(model_name: str, output_dir: str, jobs, results):
+    """Entry point of the TTS worker process: load once, then serve jobs."""
+    client = TTSClient(model_name=model_name, output_dir=output_dir)
+    try:
+        client._load_model()
+    except Exception as e:
+        results.put(("failed", repr(e)))
+        return
+    results.put(("ready", None))
+    while True:
+        job = jobs.get()
+        if job is None:
+            break
+        job_id, text, output_path = job
+        try:
+            client._synthesize_to_file(text, output_path)
+            results.put((job_id, None))
         except Exception as e:
-            logger.error(f"Error during audio file cleanup: {e}", exc_info=True)
\ No newline at end of file
+            results.put((job_id, repr(e)))
+
+
+class TTSWorker:
+    """Long-lived process that owns the TTS model (loaded exactly once).
+
+    Jobs are (text, output_path) pairs sent over a queue; a reader thread
+    resolves the matching Future when the worker reports back. If the process
+    dies (OOM, a crash inside torch/ONNX), the reader fails every outstanding
+    Future and spawns a replacement.
+    """
+
+    # How often the reader checks that the worker is still alive
+    _LIVENESS_INTERVAL = 1.0
+
+    def __init__(self, model_name: str, output_dir: str):
+        self._ctx = mp.get_context("spawn")
+        self._args = (model_name, output_dir)
+        self._pending: Dict[int, concurrent.futures.Future] = {}
+        self._ids = itertools.count()
+        self._lock = threading.Lock()
+        self._reader = None
+        self._stopping = False
+        self._jobs = self._results = self._process = None
+
+    def _spawn(self):
+        # Fresh queues: a process killed mid-get can leave the old ones locked
+        self._jobs = self._ctx.Queue()
+        self._results = self._ctx.Queue()
+        self._process = self._ctx.Process(
+            target=_tts_worker_main,
+            args=(*self._args, self._jobs, self._results),
+            name="tts-worker",
+            daemon=True
+        )
+        self._process.start()
+
+    def _wait_ready(self, timeout: float) -> bool:
+        try:
+            status, error = self._results.get(timeout=timeout)
+        except queue.Empty:
+            status, error = "failed", f"not ready after {timeout:.0f}s"
+        if status != "ready":
+            logger.error(f"TTS worker failed to load model: {error}")
+            return False
+        return True
+
+    def start(self, timeout: float = 600) -> bool:
+        """Spawn the worker and block until its model is loaded and warmed up."""
+        with self._lock:
+            self._spawn()
+        if not self._wait_ready(timeout):
+            return False
+        self._reader = threading.Thread(target=self._read_results, name="tts-worker-results", daemon=True)
+        self._reader.start()
+        return True
+
+    @staticmethod
+    def _resolve(future: concurrent.futures.Future, error: Optional[str]):
+        # The awaiting side may have cancelled the Future already
+        if future.cancelled():
+            return
+        if error is None:
+            future.set_result(None)
+        else:
+            future.set_exception(RuntimeError(error))
+
+    def _restart(self):
+        exitcode = self._process.exitcode
+        logger.error(f"TTS worker died (exit code {exitcode}), restarting it")
+        with self._lock:
+            pending, self._pending = self._pending, {}
+            self._spawn()
+        for future in pending.values():
+            self._resolve(future, f"TTS worker died (exit code {exitcode})")
+        # Jobs submitted meanwhile wait in the new queue until the model is loaded
+        self._wait_ready(timeout=600)
+
+    def _read_results(self):
+        while True:
+            try:
+                message = self._results.get(timeout=self._LIVENESS_INTERVAL)
+            except queue.Empty:
+                if self._stopping:
+                    break
+                if not self._process.is_alive():
+                    self._restart()
+                continue
+            if message is None:
+                break
+            job_id, error = message
+            with self._lock:
+                future = self._pending.pop(job_id, None)
+            if future is not None:
+                self._resolve(future, error)
+
+    def submit(self, text: str, output_path: str) -> concurrent.futures.Future:
+        """Queue a synthesis job; the Future resolves once the WAV is written."""
+        future = concurrent.futures.Future()
+        with self._lock:
+            job_id = next(self._ids)
+            self._pending[job_id] = future
+            # Under the lock so a restart cannot swap the queue in between
+            self._jobs.put((job_id, text, output_path))
+        return future
+
+    def stop(self):
+        """Ask the worker to exit and fail any jobs still waiting."""
+        self._stopping = True
+        with self._lock:
+            jobs, results, process = self._jobs, self._results, self._process
+        jobs.put(None)
+        results.put(None)
+        process.join(timeout=10)
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        for future in pending.values():
+            self._resolve(future, "TTS worker stopped")
@@ -1,16 +1,34 @@
 import asyncio
 import websockets
+import errno
+import hashlib
 import json
 import logging
 import os
+import time
 import uuid
-import re
-import threading
-import requests
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from email.message import Message
+from email.parser import BytesHeaderParser
+from functools import lru_cache
+from typing import Any, Optional
+from urllib.parse import unquote
+import httpx
 import numpy as np
+import ctranslate2
 from faster_whisper import WhisperModel
+from faster_whisper.audio import pad_or_trim
+from faster_whisper.tokenizer import Tokenizer
+from faster_whisper.vad import VadOptions, collect_chunks, get_speech_timestamps
 from freeswitchESL import ESL
 
+try:
+    from numba import njit
+except ImportError:  # optional: NumPy conversion below is used instead
+    njit = None
+
 logging.basicConfig(
     format="%(asctime)s %(levelname)s %(message)s",
     level=logging.INFO
@@ -18,14 +36,34 @@ logging.basicConfig(
 logger = logging.getLogger("ConversationalIVR")
 
 LLM_URL = "http://10.16.7.133:8000/test/transcription"
+# Stream reply audio over a per-call WebSocket as it is synthesized; False
+# uses the multipart POST to LLM_URL. Off until FIFO playback (a WAV with
+# open-ended sizes on a non-seekable pipe) is verified on the target FreeSWITCH
+LLM_STREAM_URL = "ws://10.16.7.133:8000/test/transcription_stream"
+LLM_STREAMING = False
 BASE_SAVE_FOLDER = "/usr/local/freeswitch/sounds/en/us/callie/conversationalIVR"
 os.makedirs(BASE_SAVE_FOLDER, exist_ok=True)
 
-# Updated model loading per latest reference (medium.en model, CPU, int8)
-model = WhisperModel("base.en", device="cpu", compute_type="int8")
-logger.info("Loaded faster_whisper base.en model on cpu with int8")
+# base.en on CPU: int8 weights with float32 activations (VNNI int8 GEMMs where
+# available), half the cores for CT2's intra-op threads, and two independent
+# workers so two transcriptions can run in parallel
+WHISPER_COMPUTE_TYPE = "int8_float32"
+WHISPER_CPU_THREADS = max(1, (os.cpu_count() or 2) // 2)
+WHISPER_NUM_WORKERS = 2
+logger.info(f"CTranslate2 CPU compute types: {sorted(ctranslate2.get_supported_compute_types('cpu'))}")
+model = WhisperModel(
+    "base.en",
+    device="cpu",
+    compute_type=WHISPER_COMPUTE_TYPE,
+    cpu_threads=WHISPER_CPU_THREADS,
+    num_workers=WHISPER_NUM_WORKERS,
+)
+logger.info(f"Loaded faster_whisper base.en model on cpu with {WHISPER_COMPUTE_TYPE} "
+            f"({WHISPER_CPU_THREADS} threads, {WHISPER_NUM_WORKERS} workers)")
+WHISPER_TOKENIZER = Tokenizer(model.hf_tokenizer, model.model.is_multilingual, task="transcribe", language="en")
 
 playback_counter = {}
+# call_id -> asyncio.Event, set on hangup or after a successful transfer
 call_hangup_flags = {}
 active_websocket_calls = {}
 
@@ -34,37 +72,296 @@ CHUNK_DURATION = 8  # seconds
 CHUNK_FRAMES = SAMPLE_RATE * CHUNK_DURATION
 CHUNK_SIZE = int(CHUNK_FRAMES * 2)  # 16-bit PCM, 2 bytes per sample
 
-# ESL event listener to flag hangups
-def esl_event_listener():
-    try:
-        con = ESL.ESLconnection("127.0.0.1", "8021", "ClueCon")
-        if not con.connected():
-            logger.error("ESL connection failed — cannot monitor hangups.")
-            return
-        con.events("plain", "CHANNEL_HANGUP")
-        logger.info("Subscribed to CHANNEL_HANGUP events for call hangup detection")
-        while True:
-            e = con.recvEvent()
-            if not e:
+# Energy gate ahead of Whisper (float32 RMS scale; 200/32768 in int16 terms).
+# A chunk is skipped when it is below the per-call threshold AND its
+# zero-crossing rate is low (silence/hum, not quiet fricatives); the threshold
+# follows NOISE_MARGIN x the call's rolling noise floor, clamped to the range
+SILENCE_RMS = 200 / 32768
+SILENCE_RMS_MAX = 4 * SILENCE_RMS
+SILENCE_ZCR_MAX = 0.1
+NOISE_MARGIN = 2.0
+NOISE_FLOOR_ALPHA = 0.1
+
+PCM16_SCALE = np.float32(1.0 / 32768.0)
+
+# int16 PCM -> float32 in [-1, 1) in one pass into a caller-owned buffer
+# (no intermediate int16 copy or float64 temporary)
+if njit is not None:
+    @njit(cache=True, fastmath=True)
+    def _pcm16_to_f32(pcm, out):
+        for i in range(pcm.shape[0]):
+            out[i] = pcm[i] * PCM16_SCALE
+else:
+    def _pcm16_to_f32(pcm, out):
+        np.multiply(pcm, PCM16_SCALE, out=out)
+
+def pcm16_to_f32(buf, out=None):
+    pcm = np.frombuffer(buf, dtype=np.int16)
+    if out is None or out.shape[0] != pcm.shape[0]:
+        out = np.empty(pcm.shape[0], dtype=np.float32)
+    _pcm16_to_f32(pcm, out)
+    return out
+
+class PcmBuffer:
+    """Preallocated byte buffer for a call's incoming PCM.
+
+    extend() copies each WebSocket message in once; take() hands out a
+    zero-copy view of the oldest bytes. Unread bytes (normally less than a
+    chunk) are moved to the front only when the write end reaches capacity,
+    instead of re-slicing the whole buffer on every chunk.
+    """
+
+    def __init__(self, capacity):
+        self.buf = np.empty(capacity, dtype=np.uint8)
+        self.read_idx = 0
+        self.write_idx = 0
+
+    def __len__(self):
+        return self.write_idx - self.read_idx
+
+    def extend(self, data):
+        n = len(data)
+        if self.write_idx + n > self.buf.size:
+            pending = len(self)
+            if pending + n > self.buf.size:
+                grown = np.empty(max(2 * self.buf.size, pending + n), dtype=np.uint8)
+                grown[:pending] = self.buf[self.read_idx:self.write_idx]
+                self.buf = grown
+            else:
+                self.buf[:pending] = self.buf[self.read_idx:self.write_idx]
+            self.read_idx, self.write_idx = 0, pending
+        self.buf[self.write_idx:self.write_idx + n] = np.frombuffer(data, dtype=np.uint8)
+        self.write_idx += n
+
+    def peek(self):
+        # Everything not yet taken, as a zero-copy view
+        return self.buf[self.read_idx:self.write_idx]
+
+    def take(self, n):
+        # Valid until the next extend(); callers convert it right away
+        view = self.buf[self.read_idx:self.read_idx + n]
+        self.read_idx += len(view)
+        if self.read_idx == self.write_idx:
+            self.read_idx = self.write_idx = 0
+        return view
+
+def chunk_rms(audio_np):
+    # dot() is a single BLAS pass with no temporary array
+    return float(np.sqrt(np.dot(audio_np, audio_np) / max(1, audio_np.size)))
+
+def zero_crossing_rate(audio_np):
+    signs = np.signbit(audio_np)
+    return np.count_nonzero(signs[1:] != signs[:-1]) / max(1, audio_np.size - 1)
+
+def silence_threshold(noise_floor):
+    return min(SILENCE_RMS_MAX, max(SILENCE_RMS, NOISE_MARGIN * noise_floor))
+
+def is_silent(audio_np, noise_floor):
+    rms = chunk_rms(audio_np)
+    return rms < silence_threshold(noise_floor) and zero_crossing_rate(audio_np) < SILENCE_ZCR_MAX, rms
+
+# Utterance endpointing on 20 ms frames: an utterance is cut once speech is
+# followed by ENDPOINT_SILENCE_MS of silence (or reaches CHUNK_FRAMES), so
+# Whisper runs right after the caller stops talking on ~1-3 s of audio instead
+# of on fixed 8 s wall-clock chunks. Leading silence is dropped as it arrives,
+# keeping PREROLL_MS before the first speech frame.
+FRAME_MS = 20
+FRAME_SAMPLES = SAMPLE_RATE * FRAME_MS // 1000
+FRAME_BYTES = FRAME_SAMPLES * 2
+ENDPOINT_SILENCE_MS = 300
+ENDPOINT_SILENCE_FRAMES = ENDPOINT_SILENCE_MS // FRAME_MS
+PREROLL_MS = 200
+PREROLL_BYTES = PREROLL_MS // FRAME_MS * FRAME_BYTES
+# Trailing audio left in the buffer at hangup is transcribed only from this length
+TAIL_MIN_MS = 500
+TAIL_MIN_BYTES = SAMPLE_RATE * TAIL_MIN_MS // 1000 * 2
+
+class Endpointer:
+    """Per-call frame classifier over a PcmBuffer's pending bytes."""
+
+    def __init__(self):
+        self.offset = 0  # bytes of pending audio already classified
+        self.in_speech = False
+        self.silent_run = 0  # silent frames since the last speech frame
+        self.noise_floor = SILENCE_RMS / 2
+        self.frame = np.empty(FRAME_SAMPLES, dtype=np.float32)
+
+    def next_cut(self, pending):
+        """Classify new frames; returns (n_bytes, is_utterance) or None.
+
+        is_utterance False means the first n_bytes are silence to discard.
+        """
+        while self.offset + FRAME_BYTES <= len(pending):
+            frame = pcm16_to_f32(pending[self.offset:self.offset + FRAME_BYTES], self.frame)
+            self.offset += FRAME_BYTES
+            # Energy only: line noise has a high zero-crossing rate per frame,
+            # and quiet fricatives inside speech are bridged by the hangover
+            rms = chunk_rms(frame)
+            if rms >= silence_threshold(self.noise_floor):
+                self.in_speech = True
+                self.silent_run = 0
+            elif not self.in_speech:
+                self.noise_floor += NOISE_FLOOR_ALPHA * (rms - self.noise_floor)
+                if self.offset > PREROLL_BYTES:
+                    return self._cut(self.offset - PREROLL_BYTES, False)
                 continue
-            uuid_ = e.getHeader("Caller-Unique-ID") or e.getHeader("Unique-ID")
-            if uuid_ and uuid_ in active_websocket_calls:
-                
-                # --- FIX 1: Explicitly stop the audio stream from FreeSWITCH side on hangup ---
-                stop_resp = con.api(f"uuid_audio_stream {uuid_} stop")
-                logger.info(f"Stopped audio stream for {uuid_} on hangup: {stop_resp.getBody().strip()}")
-                # -----------------------------------------------------------------------------
-                
-                call_hangup_flags[uuid_] = True
-                logger.info(f"Hangup detected for call_id {uuid_}, stopping transcription.")
-    except Exception as e:
-        logger.error(f"ESL listener crashed: {e}")
+            else:
+                self.silent_run += 1
+                if self.silent_run >= ENDPOINT_SILENCE_FRAMES:
+                    return self._cut(self.offset, True)
+            if self.offset >= CHUNK_SIZE:
+                return self._cut(self.offset, True)
+        return None
+
+    def _cut(self, n, is_utterance):
+        self.offset -= n
+        if is_utterance:
+            self.in_speech = False
+            self.silent_run = 0
+        return n, is_utterance
+
+ESL_HOST, ESL_PORT, ESL_PASSWORD = "127.0.0.1", "8021", "ClueCon"
+
+def esl_connect():
+    return ESL.ESLconnection(ESL_HOST, ESL_PORT, ESL_PASSWORD)
+
+@dataclass
+class CallSession:
+    """Per-call state: the FreeSWITCH WebSocket and one reused ESL connection.
+
+    The ESL connection is opened once per call (instead of a TCP connect +
+    auth for every playback/transfer) and is only used under esl_lock, since
+    libesl connections are not thread-safe.
+    """
+    ws: Any
+    esl: Optional[Any] = None
+    llm_ws: Optional[Any] = None  # streamed-reply WebSocket, opened on first use
+    esl_lock: asyncio.Lock = field(default_factory=asyncio.Lock)
+
+    def connection(self):
+        # Runs in a worker thread; reconnects if FreeSWITCH dropped the socket
+        if self.esl is None or not self.esl.connected():
+            self.esl = esl_connect()
+        return self.esl
+
+    def close(self):
+        if self.esl is not None:
+            try:
+                self.esl.disconnect()
+            except Exception as e:
+                logger.warning(f"Error closing ESL connection: {e}")
+            self.esl = None
+
+# ESL event listener to flag hangups. It speaks the plain-text ESL protocol over
+# an asyncio stream on the main loop, so hangup events are handled between
+# awaits instead of waking a blocking recvEvent() thread that contends for the
+# GIL with transcription callbacks
+async def read_esl_message(reader):
+    # One ESL message: header lines up to a blank line, then Content-Length body
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if not line:
+            raise ConnectionError("ESL socket closed")
+        line = line.rstrip(b"\r\n")
+        if not line:
+            if headers:
+                break
+            continue
+        key, _, value = line.decode().partition(": ")
+        headers[key] = value
+    length = int(headers.get("Content-Length", 0))
+    body = await reader.readexactly(length) if length else b""
+    return headers, body
+
+def parse_plain_event(body):
+    # text/event-plain bodies are URL-encoded "Key: value" lines, optionally
+    # followed by a blank line and the event's own body (e.g. a bgapi result)
+    head, _, content = body.decode().partition("\n\n")
+    event = {}
+    for line in head.split("\n"):
+        key, _, value = line.partition(": ")
+        event[key] = unquote(value)
+    return event, content
+
+async def esl_command(reader, writer, command):
+    writer.write(f"{command}\n\n".encode())
+    await writer.drain()
+    while True:
+        headers, _ = await read_esl_message(reader)
+        if headers.get("Content-Type") == "command/reply":
+            return headers.get("Reply-Text", "")
+
+# Job-UUID -> (call_id, dest_ext, confirmed future) for transfers sent with
+# bgapi; registered on the event loop, resolved by the listener when the
+# BACKGROUND_JOB result arrives (True on +OK)
+pending_transfers = {}
+
+# ESL listener reconnect backoff, in seconds
+ESL_RECONNECT_MIN = 1.0
+ESL_RECONNECT_MAX = 30.0
+
+def end_call_stream(writer, call_uuid):
+    # Stop the FreeSWITCH audio stream (bgapi: nothing waits on the reply) and
+    # set the hangup event that breaks the call's WebSocket loop
+    writer.write(f"bgapi uuid_audio_stream {call_uuid} stop\n\n".encode())
+    hangup = call_hangup_flags.get(call_uuid)
+    if hangup:
+        hangup.set()
+
+def handle_esl_event(writer, e, content):
+    if e.get("Event-Name") == "BACKGROUND_JOB":
+        transfer = pending_transfers.pop(e.get("Job-UUID"), None)
+        if transfer is None:
+            return
+        call_uuid, dest_ext, confirmed = transfer
+        logger.info(f"Transferred {call_uuid} to {dest_ext}: {content.strip()}")
+        ok = content.strip().startswith("+OK")
+        # --- FIX 2/3: Stop the audio stream after successful transfer ---
+        if ok and call_uuid in active_websocket_calls:
+            end_call_stream(writer, call_uuid)
+            logger.info(f"Transfer successful, setting hangup flag for {call_uuid} to close WebSocket.")
+        if not confirmed.done():
+            confirmed.set_result(ok)
+        return
 
-threading.Thread(target=esl_event_listener, daemon=True).start()
+    uuid_ = e.get("Caller-Unique-ID") or e.get("Unique-ID")
+    if uuid_ and uuid_ in active_websocket_calls:
+        # --- FIX 1: Explicitly stop the audio stream from FreeSWITCH side on hangup ---
+        end_call_stream(writer, uuid_)
+        logger.info(f"Hangup detected for call_id {uuid_}, stopping transcription.")
 
-def uuid_exists(call_uuid):
+async def esl_event_listener():
+    # Reconnects with exponential backoff, so a dropped ESL socket only pauses
+    # hangup/transfer detection; transfers also time out on their own
+    delay = ESL_RECONNECT_MIN
+    while True:
+        writer = None
+        try:
+            reader, writer = await asyncio.open_connection(ESL_HOST, int(ESL_PORT))
+            await read_esl_message(reader)  # auth/request
+            if not (await esl_command(reader, writer, f"auth {ESL_PASSWORD}")).startswith("+OK"):
+                raise ConnectionError("ESL authentication failed")
+            await esl_command(reader, writer, "event plain CHANNEL_HANGUP BACKGROUND_JOB")
+            logger.info("Subscribed to CHANNEL_HANGUP and BACKGROUND_JOB events for hangup and transfer detection")
+            delay = ESL_RECONNECT_MIN
+            while True:
+                headers, body = await read_esl_message(reader)
+                if headers.get("Content-Type") == "text/event-plain":
+                    handle_esl_event(writer, *parse_plain_event(body))
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"ESL listener disconnected ({e}), reconnecting in {delay:.0f}s")
+        finally:
+            if writer is not None:
+                writer.close()
+        await asyncio.sleep(delay)
+        delay = min(2 * delay, ESL_RECONNECT_MAX)
+
+def uuid_exists(call_uuid, session=None):
     try:
-        con = ESL.ESLconnection("127.0.0.1", "8021", "ClueCon")
+        con = session.connection() if session else esl_connect()
         if con.connected():
             resp = con.api(f"uuid_exists {call_uuid}")
             return resp.getBody().strip() == "true"
@@ -72,35 +369,124 @@ def uuid_exists(call_uuid):
         logger.error(f"Error checking uuid_exists: {e}")
     return False
 
-def wait_for_playback_stop(esl_con, call_uuid):
+# Longest a transfer waits for its announcement to finish before going ahead
+PLAYBACK_WAIT_TIMEOUT = 120.0
+
+def watch_playback(esl_con):
+    # Subscribe before uuid_broadcast: a short reply can finish (and emit
+    # PLAYBACK_STOP) before a subscription made after the broadcast
     esl_con.events("json", "PLAYBACK_STOP")
-    while True:
-        evt = esl_con.recvEvent()
-        if evt and evt.getHeader("Unique-ID") == call_uuid and evt.getHeader("Event-Name") == "PLAYBACK_STOP":
-            logger.info(f"Playback finished for call {call_uuid}")
-            break
 
-def play_audio_and_transfer(call_uuid, wav_file_path, dest_ext):
-    con = ESL.ESLconnection("127.0.0.1", "8021", "ClueCon")
+def unwatch_playback(esl_con):
+    # The connection is reused for the rest of the call: stop queueing events
+    # nobody reads
+    esl_con.sendRecv("noevents")
+
+def wait_for_playback_stop(esl_con, call_uuid, wav_file_path):
+    # Expects watch_playback() before the broadcast. Matching the file path
+    # skips stale PLAYBACK_STOP events still queued from earlier replies
+    deadline = time.monotonic() + PLAYBACK_WAIT_TIMEOUT
+    try:
+        while (remaining := deadline - time.monotonic()) > 0:
+            evt = esl_con.recvEventTimed(int(min(remaining, 1.0) * 1000))
+            if (evt and evt.getHeader("Unique-ID") == call_uuid
+                    and evt.getHeader("Event-Name") == "PLAYBACK_STOP"
+                    and evt.getHeader("Playback-File-Path") == wav_file_path):
+                logger.info(f"Playback finished for call {call_uuid}")
+                return True
+        logger.warning(f"No PLAYBACK_STOP for {call_uuid} within {PLAYBACK_WAIT_TIMEOUT:.0f}s")
+        return False
+    finally:
+        unwatch_playback(esl_con)
+
+def _finalize_transfer(con, call_uuid, dest_ext, job_uuid):
+    # Fire-and-forget: the uuid_transfer result comes back as a BACKGROUND_JOB
+    # event, and the listener stops the stream and sets the hangup flag on +OK
+    con.bgapi("uuid_transfer", f"{call_uuid} {dest_ext}", job_uuid)
+    logger.info(f"Requested transfer of {call_uuid} to {dest_ext} (job {job_uuid})")
+    return True
+
+def play_audio_and_transfer(call_uuid, wav_file_path, dest_ext, job_uuid, session=None, already_playing=False):
+    con = session.connection() if session else esl_connect()
     if not con.connected():
         logger.error("ESL connection failed for play and transfer")
+        return False
+    # already_playing: a streamed reply, broadcast (and watched) by stream_from_llm
+    if not already_playing:
+        watch_playback(con)
+        con.api(f"uuid_broadcast {call_uuid} {wav_file_path} both")
+    wait_for_playback_stop(con, call_uuid, wav_file_path)
+    return _finalize_transfer(con, call_uuid, dest_ext, job_uuid)
+
+# Blocking ESL helpers below are run via asyncio.to_thread so the libesl
+# round-trips never stall the WebSocket event loop
+def transfer_call(call_uuid, dest_ext, job_uuid, session=None):
+    con = session.connection() if session else esl_connect()
+    if not con.connected():
+        logger.error("ESL connection failed for transfer.")
+        return False
+    return _finalize_transfer(con, call_uuid, dest_ext, job_uuid)
+
+def stop_audio_stream(call_uuid, session=None):
+    con = session.connection() if session else esl_connect()
+    if not con.connected():
+        logger.error("ESL connection failed for audio stream stop.")
         return
+    resp = con.api(f"uuid_audio_stream {call_uuid} stop")
+    logger.info(f"Stopped audio stream for {call_uuid}: {resp.getBody().strip()}")
+
+# Longest a sent transfer waits for its BACKGROUND_JOB result from the listener
+TRANSFER_CONFIRM_TIMEOUT = 5.0
+
+async def transfer(session, call_id, dest_ext, wav_file_path=None, already_playing=False):
+    # Plays wav_file_path first when given. The listener normally ends the
+    # stream on +OK; if no result arrives in time (listener down or
+    # reconnecting) the stream is ended here instead, as before bgapi
+    job_uuid = str(uuid.uuid4())
+    confirmed = asyncio.get_running_loop().create_future()
+    pending_transfers[job_uuid] = (call_id, dest_ext, confirmed)
+    try:
+        async with session.esl_lock:
+            if wav_file_path:
+                sent = await asyncio.to_thread(play_audio_and_transfer, call_id, wav_file_path, dest_ext,
+                                               job_uuid, session, already_playing)
+            else:
+                sent = await asyncio.to_thread(transfer_call, call_id, dest_ext, job_uuid, session)
+        if not sent:
+            return
+        await asyncio.wait_for(confirmed, TRANSFER_CONFIRM_TIMEOUT)
+        return
+    except asyncio.TimeoutError:
+        pass
+    finally:
+        pending_transfers.pop(job_uuid, None)
+
+    logger.warning(f"No transfer result for {call_id} within {TRANSFER_CONFIRM_TIMEOUT:.0f}s, ending its stream")
+    async with session.esl_lock:
+        await asyncio.to_thread(stop_audio_stream, call_id, session)
+    hangup = call_hangup_flags.get(call_id)
+    if hangup:
+        hangup.set()
+
+def broadcast_audio(call_uuid, wav_file_path, session=None, watch=False):
+    con = session.connection() if session else esl_connect()
+    if not con.connected():
+        logger.error("ESL connection failed for playback.")
+        return
+    if watch:
+        watch_playback(con)
     con.api(f"uuid_broadcast {call_uuid} {wav_file_path} both")
-    wait_for_playback_stop(con, call_uuid)
-    
-    resp = con.api(f"uuid_transfer {call_uuid} {dest_ext}")
-    logger.info(f"Transferred {call_uuid} to {dest_ext}: {resp.getBody().strip()}")
-    
-    # --- FIX 2: Stop the audio stream after successful transfer ---
-    if resp.getBody().strip().startswith("+OK"):
-        # Explicitly stop the FreeSWITCH audio stream/WebSocket
-        stop_resp = con.api(f"uuid_audio_stream {call_uuid} stop")
-        logger.info(f"Stopped audio stream for {call_uuid} after transfer: {stop_resp.getBody().strip()}")
-        
-        # Set hangup flag to break the Python WebSocket loop
-        call_hangup_flags[call_uuid] = True
-        logger.info(f"Transfer successful, setting hangup flag for {call_uuid} to close WebSocket.")
-    # -------------------------------------------------------------
+    logger.info(f"Played audio to {call_uuid}")
+
+# Stdlib header parsing (quoting, parameters) for the response and part headers
+HEADER_PARSER = BytesHeaderParser()
+
+# The server always sends the same Content-Type, so its boundary is parsed once
+@lru_cache(maxsize=16)
+def content_type_param(content_type, param):
+    msg = Message()
+    msg["Content-Type"] = content_type
+    return msg.get_param(param)
 
 def parse_multipart_response(resp):
     content_type = resp.headers.get("Content-Type", "")
@@ -114,68 +500,319 @@ def parse_multipart_response(resp):
         except Exception:
             return {"json": None, "audio": resp.content, "audio_filename": None}
 
-    # --- ONLY FIXED PART BELOW ---
-    match = re.search(r'boundary=\"?([^\";]+)\"?', content_type)
-    # --------------------------------
+    boundary = content_type_param(content_type, "boundary")
 
-    if not match:
+    if not boundary:
         logger.error("No boundary found in Content-Type.")
         return {"json": None, "audio": None, "audio_filename": None}
 
-    boundary = match.group(1)
-    parts = resp.content.split(("--" + boundary).encode())
-
+    # Single forward walk over the body with bytes.find; parts are memoryview
+    # slices of the response buffer, so the WAV is never copied
+    content = resp.content
+    view = memoryview(content)
+    delimiter = ("--" + boundary).encode()
     json_part, audio_part, filename = None, None, None
 
-    for part in parts:
-        if not part or part in (b"--\r\n", b"--", b"\r\n"):
-            continue
-        section = part.strip(b"\r\n")
-        header_b, _, body = section.partition(b"\r\n\r\n")
-        headers = header_b.decode(errors="ignore")
+    pos = content.find(delimiter)
+    while pos != -1:
+        start = pos + len(delimiter)
+        if content.startswith(b"--", start):  # closing delimiter
+            break
+        header_end = content.find(b"\r\n\r\n", start)
+        if header_end == -1:
+            break
+        next_pos = content.find(b"\r\n" + delimiter, header_end + 4)
+        body = view[header_end + 4:next_pos if next_pos != -1 else len(content)]
+        headers = HEADER_PARSER.parsebytes(content[start:header_end].lstrip(b"\r\n"))
+        part_type = headers.get_content_type()
 
-        if "application/json" in headers:
+        if part_type == "application/json":
             try:
-                json_part = json.loads(body.decode())
+                json_part = json.loads(bytes(body))
                 logger.info(f"Found JSON part: {json_part}")
             except Exception as e:
                 logger.error(f"JSON parse failed: {e}")
 
-        elif "audio/wav" in headers or "audio/x-wav" in headers:
-            m = re.search(r'filename=\"?([^\"]+)\"?', headers)
-            filename = m.group(1) if m else "response.wav"
-            audio_part = body.strip()
+        elif part_type in ("audio/wav", "audio/x-wav"):
+            filename = headers.get_filename() or "response.wav"
+            audio_part = body
             logger.info(f"Found audio part ({len(audio_part)} bytes, name={filename})")
 
+        pos = next_pos + 2 if next_pos != -1 else -1
+
     return {"json": json_part, "audio": audio_part, "audio_filename": filename}
 
-def send_to_llm(call_id, text):
+# One pooled keep-alive client for all calls: no TCP handshake per
+# transcription, and no thread hop since the request is awaited directly
+LLM_TIMEOUT = httpx.Timeout(600.0, connect=10.0)
+HTTPX_CLIENT = httpx.AsyncClient(
+    timeout=LLM_TIMEOUT,
+    limits=httpx.Limits(max_connections=64, max_keepalive_connections=64),
+)
+
+async def send_to_llm(call_id, text):
     try:
         payload = {"call_uuid": call_id, "transcription": text}
         logger.info(f"➡️ Sending transcription to LLM: {payload}")
-        resp = requests.post(LLM_URL, json=payload)
+        resp = await HTTPX_CLIENT.post(LLM_URL, json=payload)
         return resp
     except Exception as e:
         logger.error(f"Error sending to LLM: {e}")
         return None
 
+# Streamed replies: the server sends a WAV header, then the PCM of each
+# synthesized sentence, then one JSON message. The audio goes into a FIFO that
+# uuid_broadcast is already playing, so playback starts with the first sentence
+# instead of after the whole reply is rendered and downloaded.
+FIFO_OPEN_TIMEOUT = 10.0
+
+async def open_fifo_writer(path):
+    # A non-blocking open for writing fails with ENXIO until FreeSWITCH opens
+    # the FIFO for playback; the returned pipe transport buffers writes and
+    # feeds the FIFO at playback speed without blocking the event loop
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + FIFO_OPEN_TIMEOUT
+    while True:
+        try:
+            fd = os.open(path, os.O_WRONLY | os.O_NONBLOCK)
+            break
+        except OSError as e:
+            if e.errno != errno.ENXIO or loop.time() > deadline:
+                raise
+            await asyncio.sleep(0.01)
+    transport, _ = await loop.connect_write_pipe(asyncio.Protocol, os.fdopen(fd, "wb", buffering=0))
+    return transport
+
+async def stream_from_llm(session, call_id, text):
+    # Returns (reply JSON, FIFO path the audio played from or None), or None on error
+    try:
+        if session.llm_ws is None:
+            session.llm_ws = await websockets.connect(LLM_STREAM_URL, max_size=None, ping_interval=30, ping_timeout=30)
+        payload = {"call_uuid": call_id, "transcription": text}
+        logger.info(f"➡️ Streaming transcription to LLM: {payload}")
+        await session.llm_ws.send(json.dumps(payload))
+
+        fifo_path = pipe = None
+        try:
+            while isinstance(message := await session.llm_ws.recv(), bytes):
+                if pipe is None:
+                    path = os.path.join(BASE_SAVE_FOLDER, f"stream_{call_id}_{uuid.uuid4().hex[:8]}.wav")
+                    os.mkfifo(path)
+                    fifo_path = path
+                    # Watched from the start: a transfer reply waits for its PLAYBACK_STOP
+                    async with session.esl_lock:
+                        await asyncio.to_thread(broadcast_audio, call_id, fifo_path, session, True)
+                    pipe = await open_fifo_writer(fifo_path)
+                pipe.write(message)
+        finally:
+            # close() flushes what FreeSWITCH has not read yet, then sends EOF;
+            # the FIFO name can go as soon as both ends are open
+            if pipe is not None:
+                pipe.close()
+            if fifo_path:
+                os.remove(fifo_path)
+
+        llm_json = json.loads(message)
+        if llm_json.get("status") != "success":
+            logger.error(f"LLM stream error for {call_id}: {llm_json.get('message')}")
+        return llm_json, fifo_path
+    except Exception as e:
+        logger.error(f"Error streaming from LLM for {call_id}: {e}")
+        # The rest of this reply may still be in flight: reconnect next time
+        if session.llm_ws is not None:
+            await session.llm_ws.close()
+            session.llm_ws = None
+        return None
+
+async def unwatch_streamed_playback(session):
+    # A streamed reply that does not lead to a transfer: nobody waits for its
+    # PLAYBACK_STOP, so drop the subscription stream_from_llm made
+    async with session.esl_lock:
+        if session.esl is not None:
+            await asyncio.to_thread(unwatch_playback, session.esl)
+
+# Run via asyncio.to_thread: the disk write (and any fsync the filesystem
+# does on close) must not stall the other calls' WebSocket I/O
+def save_response_audio(digest, audio_data):
+    response_path = os.path.join(BASE_SAVE_FOLDER, f"response_{digest}.wav")
+    # Written aside and renamed, so a call already playing this reply never
+    # sees a half-written file when another call misses on the same digest
+    tmp_path = f"{response_path}.{uuid.uuid4().hex}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(audio_data)
+    os.replace(tmp_path, response_path)
+    logger.info(f"Saved LLM audio: {response_path} ({len(audio_data)} bytes)")
+    return response_path
+
+def remove_response_audio(response_path):
+    try:
+        os.remove(response_path)
+    except FileNotFoundError:
+        pass
+
+# Fixed prompts ("Connecting you to sales...") come back as the same WAV bytes
+# on every call: each distinct reply is written once, named by its digest, and
+# reused by uuid_broadcast while it stays in this LRU
+RESPONSE_AUDIO_CACHE_SIZE = 256
+response_audio_cache = OrderedDict()
+
+async def response_audio_path(call_id, audio_data):
+    digest = hashlib.blake2b(audio_data, digest_size=16).hexdigest()
+    response_path = response_audio_cache.get(digest)
+    if response_path is not None:
+        response_audio_cache.move_to_end(digest)
+        logger.info(f"Reusing cached LLM audio for {call_id}: {response_path}")
+        return response_path
+
+    response_path = await asyncio.to_thread(save_response_audio, digest, audio_data)
+    response_audio_cache[digest] = response_path
+    while len(response_audio_cache) > RESPONSE_AUDIO_CACHE_SIZE:
+        # Unlinking is safe even mid-playback: FreeSWITCH keeps its open handle
+        _, evicted = response_audio_cache.popitem(last=False)
+        await asyncio.to_thread(remove_response_audio, evicted)
+    return response_path
+
 # Helper for filtering short or filler speech
-FILLER_WORDS = {
+FILLER_WORDS = frozenset({
     "the", "a", "an", "um", "uh", "er", "ah", "hm", "hmm",
     "yeah", "yep", "uh-huh", "mm-hmm", "okay", "ok",
     "thank you", "thanks", "thank", "no problem", "sure", "yes", "alright"
-}
+})
 
 def is_meaningful_text(text: str) -> bool:
-    if not text or len(text.strip()) < 5:
-        return False
-    cleaned = text.lower().strip()
-    if cleaned in FILLER_WORDS:
-        return False
-    words = cleaned.split()
-    if all(word in FILLER_WORDS for word in words):
-        return False
-    return True
+    cleaned = text.strip().lower() if text else ""
+    # all() stops at the first non-filler word, which is the common case
+    return (len(cleaned) >= 5
+            and cleaned not in FILLER_WORDS
+            and not all(word in FILLER_WORDS for word in cleaned.split()))
+
+# --- Cross-call micro-batching for Whisper ---
+# Chunks from all calls are queued per length bin and a single worker encodes up to
+# TRANSCRIBE_BATCH_MAX of them (arriving within TRANSCRIBE_BATCH_WINDOW) in one
+# CTranslate2 encoder/decoder pass instead of one transcribe() per chunk
+
+# Length bins (in samples) for the VAD-sized utterances: batches only ever mix
+# chunks from the same bin
+TRANSCRIBE_BINS = [CHUNK_FRAMES // 4, CHUNK_FRAMES // 2, CHUNK_FRAMES]
+BIN_QUEUES = {n: asyncio.Queue() for n in TRANSCRIBE_BINS}
+FULL_CHUNK_Q = BIN_QUEUES[CHUNK_FRAMES]
+TAIL_Q = asyncio.Queue()  # end-of-call remainders, transcribed one at a time
+TRANSCRIBE_READY = asyncio.Event()
+TRANSCRIBE_BATCH_MAX = 8
+TRANSCRIBE_BATCH_WINDOW = 0.02  # seconds
+# Dedicated Whisper threads, one per CT2 worker (CT2 releases the GIL while it
+# runs), so two batches are transcribed in parallel off the event loop
+TRANSCRIBE_POOL = ThreadPoolExecutor(max_workers=WHISPER_NUM_WORKERS, thread_name_prefix="whisper")
+
+def transcribe_one(audio_np):
+    segments, _ = model.transcribe(
+        audio_np,
+        beam_size=1,
+        temperature=0.0,
+        vad_filter=True,
+        word_timestamps=False,
+        language='en',
+        condition_on_previous_text=False,
+    )
+    return " ".join([s.text.strip() for s in segments if is_meaningful_text(s.text)]).strip()
+
+def speech_only(audio_np):
+    # Same Silero VAD pass transcribe(vad_filter=True) does, done before batching
+    speech_ts = get_speech_timestamps(audio_np, VadOptions())
+    if not speech_ts:
+        return audio_np[:0]
+    speech = collect_chunks(audio_np, speech_ts)
+    if isinstance(speech, tuple):  # faster-whisper >= 1.1 returns (chunks, metadata)
+        speech = np.concatenate(speech[0]) if speech[0] else audio_np[:0]
+    return speech
+
+def transcribe_batched(audios):
+    texts = [""] * len(audios)
+    speech = [speech_only(a) for a in audios]
+    active = [i for i, s in enumerate(speech) if s.size]
+    if not active:
+        return texts
+
+    n_frames = model.feature_extractor.nb_max_frames
+    features = np.stack([pad_or_trim(model.feature_extractor(speech[i]), n_frames) for i in active])
+    encoder_output = model.encode(features)
+    prompt = model.get_prompt(WHISPER_TOKENIZER, [], without_timestamps=True)
+    results = model.model.generate(encoder_output, [prompt] * len(active), beam_size=1)
+
+    for i, result in zip(active, results):
+        text = WHISPER_TOKENIZER.decode(result.sequences_ids[0]).strip()
+        texts[i] = text if is_meaningful_text(text) else ""
+    return texts
+
+def transcribe_batch(audios):
+    if len(audios) > 1:
+        try:
+            return transcribe_batched(audios)
+        except Exception as e:
+            logger.warning(f"Batched transcription failed, transcribing one by one: {e}")
+    return [transcribe_one(a) for a in audios]
+
+async def collect_batch(queue):
+    loop = asyncio.get_running_loop()
+    batch = [queue.get_nowait()]
+    deadline = loop.time() + TRANSCRIBE_BATCH_WINDOW
+    while len(batch) < TRANSCRIBE_BATCH_MAX:
+        timeout = deadline - loop.time()
+        if timeout <= 0:
+            break
+        try:
+            batch.append(await asyncio.wait_for(queue.get(), timeout))
+        except asyncio.TimeoutError:
+            break
+    return batch
+
+async def run_batch(batch, slots):
+    try:
+        texts = await asyncio.get_running_loop().run_in_executor(
+            TRANSCRIBE_POOL, transcribe_batch, [audio for audio, _ in batch]
+        )
+    except Exception as e:
+        for _, fut in batch:
+            if not fut.done():
+                fut.set_exception(e)
+        return
+    finally:
+        slots.release()
+    if len(batch) > 1:
+        logger.info(f"Transcribed a batch of {len(batch)} chunks")
+    for (_, fut), text in zip(batch, texts):
+        if not fut.done():
+            fut.set_result(text)
+
+async def transcribe_worker():
+    # One in-flight batch per CT2 worker; while both are busy, new chunks
+    # pile up in the queues and go out as a larger batch
+    slots = asyncio.Semaphore(WHISPER_NUM_WORKERS)
+    running = set()
+    while True:
+        if TAIL_Q.empty() and all(q.empty() for q in BIN_QUEUES.values()):
+            TRANSCRIBE_READY.clear()
+            await TRANSCRIBE_READY.wait()
+
+        await slots.acquire()
+        # Largest bin first (biggest batches, most throughput); tail flushes alone
+        queue = next((BIN_QUEUES[n] for n in reversed(TRANSCRIBE_BINS) if not BIN_QUEUES[n].empty()), None)
+        batch = await collect_batch(queue) if queue else [TAIL_Q.get_nowait()]
+
+        task = asyncio.create_task(run_batch(batch, slots))
+        running.add(task)
+        task.add_done_callback(running.discard)
+
+async def transcribe(audio_np, tail=False):
+    # Only same-bin chunks batch together, so a short tail never rides (padded)
+    # in a batch of full chunks
+    queue = TAIL_Q
+    if not tail:
+        queue = next((BIN_QUEUES[n] for n in TRANSCRIBE_BINS if len(audio_np) <= n), TAIL_Q)
+    fut = asyncio.get_running_loop().create_future()
+    await queue.put((audio_np, fut))
+    TRANSCRIBE_READY.set()
+    return await fut
 
 # Audio receiver WS handler
 async def audio_receiver(websocket):
@@ -195,41 +832,49 @@ async def audio_receiver(websocket):
 
     logger.info(f"WebSocket started for call {call_id}")
 
-    active_websocket_calls[call_id] = websocket
-    call_hangup_flags[call_id] = False
+    session = CallSession(ws=websocket)
+    active_websocket_calls[call_id] = session
+    hangup = call_hangup_flags[call_id] = asyncio.Event()
+    hangup_wait = asyncio.create_task(hangup.wait())
 
     TARGET_MAP = {"sales": "5000", "support": "5001", "development": "5002"}
 
-    audio_buffer = bytearray()
+    audio_buffer = PcmBuffer(CHUNK_SIZE * 3)
+    endpointer = Endpointer()
+    # Reused for every utterance of this call: each one is transcribed
+    # (awaited) before the next one is converted into it
+    chunk_f32 = np.empty(CHUNK_FRAMES, dtype=np.float32)
 
     try:
-        # Loop breaks on client disconnect, exception, or hangup flag (from ESL/Transfer)
-        async for message in websocket:
-            if call_hangup_flags.get(call_id):
+        # Loop breaks on client disconnect, exception, or hangup flag (from ESL/Transfer).
+        # The hangup event is awaited alongside recv, so a hangup ends the loop even
+        # while FreeSWITCH sends nothing
+        while True:
+            recv = asyncio.ensure_future(websocket.recv())
+            await asyncio.wait({recv, hangup_wait}, return_when=asyncio.FIRST_COMPLETED)
+            if hangup.is_set():
+                recv.cancel()
                 logger.info(f"Call {call_id} hangup flagged — stopping loop.")
                 break
+            try:
+                message = recv.result()
+            except websockets.ConnectionClosed:
+                break
 
             if isinstance(message, bytes):
                 audio_buffer.extend(message)
 
-                while len(audio_buffer) >= CHUNK_SIZE:
-                    chunk_bytes = audio_buffer[:CHUNK_SIZE]
-                    audio_buffer = audio_buffer[CHUNK_SIZE:]
-
-                    audio_int16 = np.frombuffer(chunk_bytes, dtype=np.int16).copy()
-                    audio_np = audio_int16.astype(np.float32) / 32768.0
+                while (cut := endpointer.next_cut(audio_buffer.peek())) is not None:
+                    n_bytes, is_utterance = cut
+                    utterance = audio_buffer.take(n_bytes)
+                    if not is_utterance:
+                        # Leading silence: never reaches the Whisper encoder
+                        continue
 
-                    segments, _ = model.transcribe(
-                        audio_np,
-                        beam_size=1,
-                        temperature=0.0,
-                        vad_filter=True,
-                        word_timestamps=False,
-                        language='en',
-                        condition_on_previous_text=False,
-                    )
+                    audio_np = pcm16_to_f32(utterance, chunk_f32[:n_bytes // 2])
+                    logger.debug(f"Utterance of {n_bytes / 2 / SAMPLE_RATE:.2f}s for call {call_id}")
 
-                    text = " ".join([s.text.strip() for s in segments if is_meaningful_text(s.text)]).strip()
+                    text = await transcribe(audio_np)
 
                     if not text:
                         logger.info(f"No meaningful speech recognized for call {call_id}, skipping LLM call and playback")
@@ -237,72 +882,59 @@ async def audio_receiver(websocket):
 
                     logger.info(f"Whisper recognized: '{text}'")
 
-                    resp = await asyncio.to_thread(send_to_llm, call_id, text)
-                    if not resp:
-                        logger.error(f"No LLM response for {call_id}")
-                        continue
-
-                    if resp.status_code == 200:
+                    streamed_path = audio_data = None
+                    if LLM_STREAMING:
+                        # Audio is already playing from the FIFO when this returns
+                        reply = await stream_from_llm(session, call_id, text)
+                        if reply is None:
+                            continue
+                        llm_json, streamed_path = reply
+                    else:
+                        resp = await send_to_llm(call_id, text)
+                        if not resp:
+                            logger.error(f"No LLM response for {call_id}")
+                            continue
+                        if resp.status_code != 200:
+                            logger.error(f"LLM HTTP {resp.status_code} for {call_id}")
+                            continue
                         parsed = parse_multipart_response(resp)
                         llm_json, audio_data = parsed["json"], parsed["audio"]
 
-                        transfer_data = None
-                        if llm_json:
-                            if "transfer_request" in llm_json:
-                                transfer_data = llm_json
-                            elif "transfer" in llm_json and isinstance(llm_json["transfer"], dict):
-                                transfer_data = llm_json["transfer"]
-
-                        if transfer_data and transfer_data.get("transfer_request"):
-
-                            target = (transfer_data.get("transfer_target") or "").strip().lower()
-                            dest_ext = TARGET_MAP.get(target)
-
-                            if dest_ext and audio_data:
-                                response_path = os.path.join(BASE_SAVE_FOLDER, f"{call_id}_response.wav")
-                                with open(response_path, "wb") as f:
-                                    f.write(audio_data)
-                                logger.info(f"Saved LLM audio: {response_path} ({len(audio_data)} bytes)")
-                                
-                                # Calls uuid_transfer and sets hangup flag/stops stream on success
-                                await asyncio.to_thread(play_audio_and_transfer, call_id, response_path, dest_ext)
-
-                            elif dest_ext:
-                                con = ESL.ESLconnection("127.0.0.1", "8021", "ClueCon")
-                                if con.connected():
-                                    resp = con.api(f"uuid_transfer {call_id} {dest_ext}")
-                                    logger.info(f"Transferred {call_id} to {dest_ext}: {resp.getBody().strip()}")
-                                    
-                                    # --- FIX 3: Stop stream and set hangup flag (Non-audio path) ---
-                                    if resp.getBody().strip().startswith("+OK"):
-                                        stop_resp = con.api(f"uuid_audio_stream {call_id} stop")
-                                        logger.info(f"Stopped audio stream for {call_id} after transfer: {stop_resp.getBody().strip()}")
-                                        
-                                        call_hangup_flags[call_id] = True
-                                        logger.info(f"Transfer successful, setting hangup flag for {call_id} to close WebSocket.")
-                                    # -----------------------------------------------------------------
-                                else:
-                                    logger.error("ESL connection failed for transfer.")
-
-                            else:
-                                logger.warning(f"Unknown transfer target '{target}' for call {call_id}")
+                    transfer_data = None
+                    if llm_json:
+                        if "transfer_request" in llm_json:
+                            transfer_data = llm_json
+                        elif "transfer" in llm_json and isinstance(llm_json["transfer"], dict):
+                            transfer_data = llm_json["transfer"]
+
+                    if transfer_data and transfer_data.get("transfer_request"):
+
+                        target = (transfer_data.get("transfer_target") or "").strip().lower()
+                        dest_ext = TARGET_MAP.get(target)
+
+                        if dest_ext and (audio_data or streamed_path):
+                            response_path = streamed_path or await response_audio_path(call_id, audio_data)
+                            
+                            # Plays (unless streamed), then requests uuid_transfer; the ESL listener
+                            # stops the stream and sets the hangup flag once the transfer succeeds
+                            await transfer(session, call_id, dest_ext, response_path, bool(streamed_path))
+
+                        elif dest_ext:
+                            await transfer(session, call_id, dest_ext)
 
                         else:
-                            if audio_data:
-                                response_path = os.path.join(BASE_SAVE_FOLDER, f"{call_id}_response.wav")
-                                with open(response_path, "wb") as f:
-                                    f.write(audio_data)
-                                logger.info(f"Saved LLM audio: {response_path} ({len(audio_data)} bytes)")
-
-                                con = ESL.ESLconnection("127.0.0.1", "8021", "ClueCon")
-                                if con.connected():
-                                    con.api(f"uuid_broadcast {call_id} {response_path} both")
-                                    logger.info(f"Played audio to {call_id}")
-                                else:
-                                    logger.error("ESL connection failed for playback.")
+                            logger.warning(f"Unknown transfer target '{target}' for call {call_id}")
+                            if streamed_path:
+                                await unwatch_streamed_playback(session)
 
                     else:
-                        logger.error(f"LLM HTTP {resp.status_code} for {call_id}")
+                        if audio_data:
+                            response_path = await response_audio_path(call_id, audio_data)
+
+                            async with session.esl_lock:
+                                await asyncio.to_thread(broadcast_audio, call_id, response_path, session)
+                        elif streamed_path:
+                            await unwatch_streamed_playback(session)
 
             else:
                 logger.debug(f"Non-bytes message received: {repr(message)}")
@@ -319,32 +951,32 @@ async def audio_receiver(websocket):
             logger.warning(f"Error during WebSocket close for {call_id}: {e}")
         # ---------------------------------------------------------------------------
 
+        hangup_wait.cancel()
         active_websocket_calls.pop(call_id, None)
+        if session.llm_ws is not None:
+            await session.llm_ws.close()
+        async with session.esl_lock:
+            await asyncio.to_thread(session.close)
         call_hangup_flags.pop(call_id, None)
 
-        # Final transcription attempt for remaining buffer
-        if audio_buffer:
+        # Final transcription attempt for remaining buffer, skipped when it is
+        # too short to hold a word or is silence at the call's noise floor
+        if len(audio_buffer) >= TAIL_MIN_BYTES:
             try:
-                audio_int16 = np.frombuffer(audio_buffer, dtype=np.int16).copy()
-                audio_np = audio_int16.astype(np.float32) / 32768.0
-
-                segments, _ = model.transcribe(
-                    audio_np,
-                    beam_size=1,
-                    temperature=0.0,
-                    vad_filter=True,
-                    word_timestamps=False,
-                    language='en',
-                    condition_on_previous_text=False,
-                )
-
-                final_text = " ".join([seg.text.strip() for seg in segments if is_meaningful_text(seg.text)]).strip()
-                if final_text:
-                    logger.info(f"Final whisper text for {call_id}: {final_text}")
+                audio_np = pcm16_to_f32(audio_buffer.take(len(audio_buffer)))
+                silent, rms = is_silent(audio_np, endpointer.noise_floor)
+                if silent:
+                    logger.debug(f"Skipping silent trailing audio for {call_id} (rms={rms:.4f})")
+                else:
+                    final_text = await transcribe(audio_np, tail=True)
+                    if final_text:
+                        logger.info(f"Final whisper text for {call_id}: {final_text}")
             except Exception as e:
                 logger.error(f"Failed final whisper transcription for {call_id}: {e}")
 
 async def main():
+    transcriber = asyncio.create_task(transcribe_worker())
+    esl_listener = asyncio.create_task(esl_event_listener())
     server = await websockets.serve(
         audio_receiver,
         "10.16.7.91",
@@ -355,6 +987,9 @@ async def main():
     )
     logger.info("Faster-Whisper Conversational IVR server ready at ws://10.16.7.91:8089")
     await server.wait_closed()
+    transcriber.cancel()
+    esl_listener.cancel()
+    await HTTPX_CLIENT.aclose()
 
 if __name__ == "__main__":
     try: